@@ -1,11 +1,55 @@
 from Components.BasicComponent import Component
-from simpyExtensions.util import CrossbarGet, NewEvent
-import random
+from simpyExtensions.util import CrossbarGet, NewEvent, EventPool
+from simpyExtensions.trace import XBAR_ROUTED, XBAR_UNMASK_CREATED, XBAR_ARB_READY, XBAR_ARB_WAIT, XBAR_ARB_RETRY, XBAR_SENT, \
+    XBAR_PEEK_REFRESH, XBAR_ELECTED_RANDOM, XBAR_ELECTED_RR, XBAR_ELECTED_RR_UNMASKED, XBAR_ELECTED_WRR, XBAR_ELECTED_FP, \
+    XBAR_ELECTED_FP_UNMASKED, XBAR_PORTS_UNMASKED, BUFFER_GET_DELAYS
 from SimSettings import simTicksPerCycle
 from statistics import mean
 
+#---------------------------------------------------------------------------------
+# inPort bitmasks: bit i is set when inPort i takes part in the arbitration
+#---------------------------------------------------------------------------------
+def maskPorts(mask):
+    """returns the list of the ports whose bit is set in mask, in increasing order"""
+
+    ports=[]
+    while mask:
+        low=mask&-mask
+        ports.append(low.bit_length()-1)
+        mask^=low
+    return ports
+
+def pktMask(pktList):
+    """returns the bitmask of the ports holding a packet in a list of packets indexed by port (None if no packet)"""
+
+    mask=0
+    for port, pkt in enumerate(pktList):
+        if pkt is not None:
+            mask|=1<<port
+    return mask
+
+def rotatedPorts(mask, start):
+    """generator over the ports whose bit is set in mask, starting at port start and wrapping around"""
+
+    high=mask>>start<<start
+    for ports in (high, mask^high):
+        while ports:
+            low=ports&-ports
+            yield low.bit_length()-1
+            ports^=low
+
+def roundRobinWinner(mask, last):
+    """returns the first port whose bit is set in mask after port last, wrapping around (None if mask is empty)"""
+
+    last+=1
+    higher=mask>>last<<last
+    winner=(higher&-higher) or (mask&-mask)
+    return winner.bit_length()-1 if winner else None
+
 class Crossbar(Component):
 
+    electedCode=XBAR_ELECTED_RANDOM #the trace record of a decision, matching the message of postDecisionMsg()
+
     def __init__(self, env, name="", parent=None, inPorts=2,outPorts=1,pushMode=False,monitorBW=False,monitorInterval=500):
 
         Component.__init__(self,env, name, parent)
@@ -18,39 +62,59 @@ class Crossbar(Component):
         self.pushMode=pushMode
         self.peekEvents=[None]*self.inPorts
         self.unMaskEvents=[None]*self.inPorts
+        self.peekPorts={} #the inPort of each current peek event, kept up to date by _setPeekEvent
+        self.unMaskPorts={} #the inPort of each current unMask event, kept up to date by _setUnMaskEvent
+        self.armedPorts=0 #bitmask of the inPorts whose current unMask event calls _schedule_arbitration when it succeeds
 
         self.routes=[None]*self.inPorts #stores the destination outPort of packets on inPorts (None is no packets)
         self.routedPktList=[None]*self.inPorts #stores the modified packet due to routing on each inPort, or simply the original packet
+        self.requestMasks=[0]*self.outPorts #bitmask of the inPorts holding a packet routed to each outPort
+        self.routingTable=None #list indexed by destination of the outPorts, see setRoutingTable()
+        self.routingCandidates=None
+        self.routingField=None
         self.lastport=[-1]*self.outPorts
 
+        # subclasses arbitrate over bitmasks (arbitrateMask), unless they override arbitratePkts below it
+        self.maskArbitration=True
+        for cls in type(self).__mro__:
+            if 'arbitrateMask' in cls.__dict__:
+                break
+            if 'arbitratePkts' in cls.__dict__:
+                self.maskArbitration=False
+                break
+        # the default unMask events are already successful, no grant can invalidate them
+        self.staticUnMask=type(self).unMask is Crossbar.unMask
+
         self.get_queues=[]
         for i in range(self.outPorts):
             self.get_queues.append([])
 
         self.arbEvents=[None]*self.outPorts
+        self.upGetEvents=[None]*self.outPorts #the get event issued upstream for the packet currently forwarded to each outPort
+        self.getPool=EventPool(env,CrossbarGet)
+        self.eventPool=EventPool(env,NewEvent)
         self.monitorBW=monitorBW
         self.monitorInterval=monitorInterval*simTicksPerCycle
         self.timeSamples=[]
         self.totalBitsSent=[]
         self.lastActivity=[]
         self.firstActivity=[]
-        self.bw=[]
+        self.bitsSinceSample={} #bits sent by each (inPort, outPort) pair since the last bandwidth sample, if any
+        self.bwSamples={} #the (sample index, bw) of the samples of each (inPort, outPort) pair that sent any bits
 
         for inPort in  range(self.inPorts):
             self.lastActivity.append([])
             self.firstActivity.append([])
             self.totalBitsSent.append([])
-            self.bw.append([])
 
             for outPort in range(self.outPorts):
                 self.lastActivity[inPort].append(None)
                 self.firstActivity[inPort].append(None)
                 self.totalBitsSent[inPort].append(0)
-                self.bw[inPort].append([])
 
     def route(self, peekEvent):
 
-        inPort=self.peekEvents.index(peekEvent) #the inPort at which the packet was detected
+        inPort=self.inPortOf(peekEvent) #the inPort at which the packet was detected
         pkt=peekEvent.value  # the original packet before 
 
         #------Customizable Routing Routine ----–--#
@@ -58,16 +122,39 @@ class Crossbar(Component):
             the packet to be directed to. it can also
              manipulate the pkt"""
 
-        outPort=0
+        if self.routingTable is None:
+            outPort=0
+        elif self.routingCandidates is None:
+            outPort=self.routingTable[pkt.f[self.routingField]]
+        else:
+            outPort=self.adaptiveRoute(pkt, inPort, self.routingCandidates[pkt.f[self.routingField]])
         #--------------END-----------------------#
 
 
         #-----maintaining list of routed packets and their destinations---#
         self.routes[inPort]=outPort
         self.routedPktList[inPort]=pkt
-        inPortName=self.toUp[inPort].name if self.inPorts>1 else self.toUp.name
-        outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
-        self.Log('DEBUG','Packet {} from {} was routed to {}'.format(pkt.uid, inPortName, outPortName))
+        if self.tracer:
+            self.tracer.record(self, XBAR_ROUTED, pkt.uid, inPort, outPort)
+        if self.isLogEnabled('DEBUG', pkt):
+            inPortName=self.toUp[inPort].name if self.inPorts>1 else self.toUp.name
+            outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
+            self.Log('DEBUG','Packet {} from {} was routed to {}', pkt.uid, inPortName, outPortName, pkt=pkt)
+
+    def setRoutingTable(self, table, field):
+        """makes route() send the packets to the outPort of their destination in a RoutingTable (see
+            Components.Routing), the destination being the field of the packet (pkt.f[field])"""
+
+        self.routingTable=table.outPorts
+        self.routingCandidates=table.candidates
+        self.routingField=field
+
+    def adaptiveRoute(self, pkt, inPort, candidates):
+        """a customizable function choosing the outPort of a packet among the candidates of its destination in an
+            adaptive RoutingTable. The default is the candidate with the fewest packets already routed to it, the
+            first one on a tie"""
+
+        return min(candidates, key=lambda outPort: bin(self.requestMasks[outPort]).count('1'))
 
     def unMask(self,pkt,outport):
 
@@ -81,27 +168,38 @@ class Crossbar(Component):
             But this can be customized to return a not-yet-successful event.
 
         """
-        return NewEvent(self.env).succeed()
+        return self.eventPool.acquire(self.env).succeed()
 
-    def arbitratePkts(self,pktList, outPort=0):
-        """ a customizable function that performs the arbitration between unmasked packets.
-            the default is to choose a random input port to proceed to the outPort passed as
-            argument"""
+    def arbitrateMask(self, mask, outPort=0):
+        """ a customizable function that performs the arbitration between unmasked packets, passed as the bitmask
+            of their inPorts (the packets are in self.routedPktList). It returns the elected inPort and sets
+            self.lastport[outPort] to it. The default is to choose a random input port to proceed to the outPort
+            passed as argument"""
 
-        activeports=[i for i, pkt in enumerate(pktList) if pkt != None]
+        activeports=maskPorts(mask)
 
         if activeports:
-            candidate=random.choice(activeports)
+            candidate=self.rng.choice(activeports)
             self.lastport[outPort]=candidate   
         else:
             candidate=None
         return candidate
 
+    def arbitratePkts(self,pktList, outPort=0):
+        """ performs the arbitration between the unmasked packets of a list indexed by inPort (None if no
+            packet). Crossbars overriding this function instead of arbitrateMask are passed the list of packets
+            (built for every decision), those that do not are directly passed the bitmask"""
+
+        return self.arbitrateMask(pktMask(pktList), outPort)
+
     def postDecisionMsg(self,candidate):
 
+        if not self.isLogEnabled('INFO', self.routedPktList[candidate]):
+            return
         inPortName=self.toUp[candidate].name if self.inPorts>1 else self.toUp.name
         outPortName=self.toDn[self.routes[candidate]].name if self.outPorts>1 else self.toDn.name                
-        self.Log("INFO", "Random Arbitration elected packet {} from {} to proceed towards {}".format(self.routedPktList[candidate].uid, inPortName, outPortName))
+        self.Log("INFO", "Random Arbitration elected packet {} from {} to proceed towards {}", self.routedPktList[candidate].uid, inPortName, outPortName,
+            pkt=self.routedPktList[candidate])
 
     def run(self):
         
@@ -120,17 +218,13 @@ class Crossbar(Component):
 
     def run_init(self):
         
-        if self.inPorts==1:
-
-            self.peekEvents=[self.toUp.peek(0,caller=self)]
-
-        else:
-            self.peekEvents=[self.toUp[inPort].peek(inPort,caller=self) for inPort in range(self.inPorts)]
+        for inPort in range(self.inPorts):
+            upstream=self.toUp[inPort] if self.inPorts>1 else self.toUp
+            self._setPeekEvent(inPort, upstream.peek(inPort,caller=self))
 
         for inPort in range(self.inPorts):
 
             if self.peekEvents[inPort].triggered:
-                self.route(self.peekEvents[inPort])
                 self._postPeekProcessing(self.peekEvents[inPort])
 
             else:
@@ -140,7 +234,9 @@ class Crossbar(Component):
 
         while True:
             
-            pkt= yield self.get(outPort)
+            getEvent=self.get(outPort)
+            pkt= yield getEvent
+            getEvent.recycle()
             inPort=self.lastport[outPort]
             
             if self.firstActivity[inPort][outPort]==None:
@@ -154,38 +250,106 @@ class Crossbar(Component):
 
                 yield self.toDn.put(pkt,caller=caller)
 
-            self.totalBitsSent[inPort][outPort]+=8*pkt.getBytes()
+            bits=8*pkt.getBytes()
+            self.totalBitsSent[inPort][outPort]+=bits
             self.lastActivity[inPort][outPort]=self.env.now
+            if self.monitorBW and bits:
+                self.bitsSinceSample[inPort, outPort]=self.bitsSinceSample.get((inPort, outPort), 0)+bits
+            self.wakeMonitor()
+
+    def registerSignals(self, vcd):
+
+        # the inPort granted to each outPort, x while no packet is being sent
+        width=max((self.inPorts-1).bit_length(), 1)
+        self.grantSignals=[vcd.signal(self, 'grant_'+(self.toDn[outPort].name if self.outPorts>1 else self.toDn.name), width, None)
+                           for outPort in range(self.outPorts)]
 
     def get(self, outPort=0):
 
-        return CrossbarGet(self, outPort)
+        return self.getPool.acquire(self, outPort)
+
+    def inPortOf(self, peekEvent):
+        """returns the inPort a peek event of the crossbar was issued on, for use in customized route() functions"""
+
+        return self.peekPorts[peekEvent]
+
+    def _setPeekEvent(self, inPort, event):
+
+        old=self.peekEvents[inPort]
+        if old is not None and self.peekPorts.get(old)==inPort:
+            del self.peekPorts[old]
+        self.peekEvents[inPort]=event
+        self.peekPorts[event]=inPort
+
+    def _setUnMaskEvent(self, inPort, event):
+
+        old=self.unMaskEvents[inPort]
+        if old is not None and self.unMaskPorts.get(old)==inPort:
+            del self.unMaskPorts[old]
+        self.unMaskEvents[inPort]=event
+        self.armedPorts&=~(1<<inPort)
+        if event is not None:
+            self.unMaskPorts[event]=inPort
+
+    def unMaskedPorts(self, outPort):
+        """returns the bitmask of the inPorts routed to outPort whose packet is unmasked"""
+
+        mask=0
+        requests=self.requestMasks[outPort]
+        while requests:
+            low=requests&-requests
+            if self.unMaskEvents[low.bit_length()-1].triggered:
+                mask|=low
+            requests^=low
+        return mask
 
     def _postPeekProcessing(self,peekEvent):
 
-        inPort=self.peekEvents.index(peekEvent)
+        inPort=self.peekPorts[peekEvent]
 
         if self.routes[inPort]==None:
 
             self.route(peekEvent)
+            self.requestMasks[self.routes[inPort]]|=1<<inPort
+            if self.pathRecorder:
+                self.pathRecorder.enter(self, peekEvent.value)
+            if self.deadlockWatchdog:
+                self.deadlockWatchdog.wakeMonitor()
+
+        self._refreshUnMask(inPort)
+        self._checkArbitration(self.routes[inPort], self.routedPktList[inPort])
+
+    def _refreshUnMask(self, inPort):
+        """creates the unMask event of the packet routed on inPort, recycling the one it replaces"""
 
         outPort=self.routes[inPort]
         pkt=self.routedPktList[inPort]
 
-        #create unmask event
-        self.unMaskEvents[inPort]=self.unMask(pkt,outPort)
+        self._recycle(self.unMaskEvents[inPort])
+        self._setUnMaskEvent(inPort, self.unMask(pkt,outPort))
+
+        if self.tracer:
+            self.tracer.record(self, XBAR_UNMASK_CREATED, pkt.uid, inPort,
+                outPort|self.tracer.stringId(type(self.unMaskEvents[inPort]).__name__)<<16)
 
-        outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
-        inPortName=self.toUp[inPort].name if self.inPorts>1 else self.toUp.name
+        if self.isLogEnabled('DEBUG', pkt):
+            outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
+            inPortName=self.toUp[inPort].name if self.inPorts>1 else self.toUp.name
+
+            self.Log('DEBUG','Creating unMask event ({}) for packet {} to proceed from {} to {}.',
+                type(self.unMaskEvents[inPort]).__name__, pkt.uid, inPortName, outPortName, pkt=pkt)
 
-        self.Log('DEBUG','Creating unMask event ({}) for packet {} to proceed from {} to {}.'\
-            .format(type(self.unMaskEvents[inPort]).__name__, pkt.uid, inPortName, outPortName )) 
+    def _checkArbitration(self, outPort, pkt=None):
+        """schedules an arbitration for outPort if any packet routed to it is unmasked, otherwise makes sure the
+            unMask event of every packet routed to it will schedule one once it succeeds"""
 
-        activeInPorts=[inPort for inPort in range(self.inPorts) if (self.routes[inPort]==outPort)]
+        debug=self.isLogEnabled('DEBUG', pkt)
+        if debug:
+            outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
 
         arbScheduled=False
 
-        for inPort in activeInPorts:
+        for inPort in maskPorts(self.requestMasks[outPort]):
 
             if self.unMaskEvents[inPort].triggered:
                 arbScheduled=True
@@ -193,32 +357,38 @@ class Crossbar(Component):
                 if not self.arbEvents[outPort]:
                     self._schedule_arbitration(self.unMaskEvents[inPort])
 
-                    self.Log('DEBUG','One or more Packets for outPort {} are unMasked. Arbitration will now proceed'\
-                        .format(outPortName)) 
+                    if self.tracer:
+                        self.tracer.record(self, XBAR_ARB_READY, value=outPort)
+                    if debug:
+                        self.Log('DEBUG','One or more Packets for outPort {} are unMasked. Arbitration will now proceed', outPortName)
                 break
 
-            else:
+            elif not self.armedPorts>>inPort&1:
+                # the callback is only added once to each unMask event
                 self.unMaskEvents[inPort].callbacks.append(self._schedule_arbitration) 
+                self.armedPorts|=1<<inPort
 
 
-        if not arbScheduled:
+        if not arbScheduled and self.tracer:
+            self.tracer.record(self, XBAR_ARB_WAIT, value=outPort)
+        if not arbScheduled and debug:
 
-            self.Log('DEBUG','No unMasked Packets for outPort {}. Adding callbacks to schedule an arbitration Once any packet is unMasked.'\
-                .format(outPortName)) 
+            self.Log('DEBUG','No unMasked Packets for outPort {}. Adding callbacks to schedule an arbitration Once any packet is unMasked.', outPortName)
 
     def _schedule_arbitration(self, unMaskEvent):
 
-        if unMaskEvent not in self.unMaskEvents:
+        # unMask events replaced since the callback was added are no longer mapped to a port
+        unMaskedPort=self.unMaskPorts.get(unMaskEvent)
+        if unMaskedPort is None:
             return
 
-        unMaskedPort=self.unMaskEvents.index(unMaskEvent)
         outPort=self.routes[unMaskedPort]
 
         if not self.arbEvents[outPort] and self.get_queues[outPort]:
-            self.arbEvents[outPort]=NewEvent(self.env,outPort)
+            self.arbEvents[outPort]=self.eventPool.acquire(self.env,outPort)
             self.arbEvents[outPort].callbacks.append(self._do_get)
             self.arbEvents[outPort].succeed()
-            outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
+            # outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
             # self.Log('DEBUG','unMasked Packets for outPort {} Readily Available. Arbitration will proceed.'\
             #     .format(outPortName)) 
 
@@ -230,14 +400,19 @@ class Crossbar(Component):
         if not self.get_queues[outPort]:
             return
         
-        unMaskedInPorts=[inPort for inPort in range(self.inPorts) if (self.routes[inPort]==outPort and self.unMaskEvents[inPort].triggered)]
-        pktList=[(self.routedPktList[inPort] if inPort in unMaskedInPorts else None) for inPort in range(self.inPorts)]
+        mask=self.unMaskedPorts(outPort)
         
-        if any(pktList):
+        if mask:
             previous=self.lastport[outPort]
-            chosenPort=self.arbitratePkts(pktList,outPort)
+            if self.maskArbitration:
+                chosenPort=self.arbitrateMask(mask,outPort)
+            else:
+                pktList=[(self.routedPktList[inPort] if mask>>inPort&1 else None) for inPort in range(self.inPorts)]
+                chosenPort=self.arbitratePkts(pktList,outPort)
+            if self.tracer:
+                self.tracer.record(self, self.electedCode, self.routedPktList[chosenPort].uid, chosenPort, self.routes[chosenPort])
             self.postDecisionMsg(chosenPort)
-            pkt=pktList[chosenPort]
+            pkt=self.routedPktList[chosenPort]
 
         else:
             self.Log('FATAL_ERROR','Unexpected empty list of unmasked Packets to proceed to outPort {}'\
@@ -246,22 +421,29 @@ class Crossbar(Component):
         upstream=self.toUp[chosenPort] if self.inPorts>1 else self.toUp
 
         upGet=upstream.get(chosenPort,caller=self)
+        self.upGetEvents[outPort]=upGet
 
         if upGet:
             preGetDelay=upstream.addPreGetDelay(pkt)
             postGetDelay=upstream.addPostGetDelay(pkt)
-            upstream.Log("DEBUG","PreGetDelay is {} ticks. PostGetDelay is {} ticks".format(preGetDelay,postGetDelay))
+            if upstream.tracer:
+                upstream.tracer.record(upstream, BUFFER_GET_DELAYS, port=preGetDelay, value=postGetDelay)
+            upstream.Log("DEBUG","PreGetDelay is {} ticks. PostGetDelay is {} ticks", preGetDelay, postGetDelay, pkt=pkt)
             self.get_queues[outPort][0].succeed(pkt, delay=preGetDelay)
             self.get_queues[outPort].pop(0)
+            if self.vcd:
+                self.vcd.change(self.grantSignals[outPort], chosenPort)
 
-            cleanupEvent=NewEvent(self.env,outPort)
+            cleanupEvent=self.eventPool.acquire(self.env,outPort)
             cleanupEvent.callbacks.append(self._cleanup)
             cleanupEvent.succeed(chosenPort,delay=preGetDelay+postGetDelay)
         else:
             self.lastport[outPort]=previous
-            cleanupEvent=NewEvent(self.env,outPort)
+            cleanupEvent=self.eventPool.acquire(self.env,outPort)
             cleanupEvent.callbacks.append(self._cleanup)
             cleanupEvent.succeed(chosenPort,delay=simTicksPerCycle)
+            if self.tracer:
+                self.tracer.record(self, XBAR_ARB_RETRY)
             self.Log('DEBUG','Arbitration is re-scheduled for the next cycle')
 
     def _cleanup(self, cleanupEvent):
@@ -272,19 +454,34 @@ class Crossbar(Component):
         pkt=self.routedPktList[activatedInPort]
 
         if activatedInPort==self.lastport[outPort]:
-            self.Log('DEBUG','Finished Sending Packet {} sent from inPort {} towards outPort {}. Cleaning up and refreshing Peek and UnMask Events'\
-                .format(pkt.uid, activatedInPort, outPort))
+            if self.tracer:
+                self.tracer.record(self, XBAR_SENT, pkt.uid, activatedInPort, outPort)
+            self.Log('DEBUG','Finished Sending Packet {} sent from inPort {} towards outPort {}. Cleaning up and refreshing Peek and UnMask Events',
+                pkt.uid, activatedInPort, outPort, pkt=pkt)
+            if self.pathRecorder:
+                self.pathRecorder.leave(self, pkt)
+            if self.vcd:
+                self.vcd.change(self.grantSignals[outPort], None)
 
 
+        self.requestMasks[self.routes[activatedInPort]]&=~(1<<activatedInPort)
         self.routes[activatedInPort]=None
         self.routedPktList[activatedInPort]=None
-        self.unMaskEvents[activatedInPort]=None
+        self._recycle(self.unMaskEvents[activatedInPort])
+        self._setUnMaskEvent(activatedInPort, None)
+        self._recycle(self.arbEvents[outPort])
         self.arbEvents[outPort]=None
+        self._recycle(self.upGetEvents[outPort])
+        self.upGetEvents[outPort]=None
+        cleanupEvent.recycle()
 
         upstream=self.toUp[activatedInPort] if self.inPorts>1 else self.toUp
         
-        self.Log('DEBUG','Refreshing Peek onto inPort {}.'.format(activatedInPort))
-        self.peekEvents[activatedInPort]=upstream.peek(activatedInPort,caller=self)
+        if self.tracer:
+            self.tracer.record(self, XBAR_PEEK_REFRESH, port=activatedInPort)
+        self.Log('DEBUG','Refreshing Peek onto inPort {}.', activatedInPort)
+        self._recycle(self.peekEvents[activatedInPort])
+        self._setPeekEvent(activatedInPort, upstream.peek(activatedInPort,caller=self))
 
 
         if self.peekEvents[activatedInPort].triggered:
@@ -293,46 +490,75 @@ class Crossbar(Component):
         else:
             self.peekEvents[activatedInPort].callbacks.append(self._postPeekProcessing)
 
-        for inPort in range(self.inPorts):
-            if self.routes[inPort]==outPort and inPort!=activatedInPort:
-                self._postPeekProcessing(self.peekEvents[inPort])
+        # the grant may have invalidated the unMask events that already succeeded (eg the credit they waited for
+        # was consumed): only those are created again, the pending ones still schedule an arbitration when they succeed.
+        # The default unMask events cannot be invalidated and are kept
+        waiting=self.requestMasks[outPort]&~(1<<activatedInPort)
+        if waiting:
+            if not self.staticUnMask:
+                for inPort in maskPorts(waiting):
+                    if self.unMaskEvents[inPort].triggered:
+                        self._refreshUnMask(inPort)
+            self._checkArbitration(outPort)
+
+    def _recycle(self, event):
+        """Hands an event the crossbar no longer refers to back to its pool. Events that do not
+            come from a pool (e.g. returned by a customized unMask()) are left alone"""
+
+        if isinstance(event, NewEvent):
+            event.recycle()
 
     def bwMonitor(self):
 
-        lastTotalBitsSent=[]
-        for ip in  range(len(self.totalBitsSent)):
-            lastTotalBitsSent.append([])
-            for op in range(len(self.totalBitsSent[ip])):
-                lastTotalBitsSent[ip].append(0)
-               
-        bw_interval=0
+        # only the pairs that sent bits during the interval get a sample, the others are implicitly 0
+        nextSample=self.monitorInterval
 
         while True:
 
-            yield self.env.timeout(self.monitorInterval)
+            yield self.env.timeout(nextSample)
 
-            for ip in  range(len(self.totalBitsSent)):
-                for op in range(len(self.totalBitsSent[ip])):
-
-                    bw_interval = (self.totalBitsSent[ip][op] - lastTotalBitsSent[ip][op]) / (self.monitorInterval)
-                    self.bw[ip][op].append(bw_interval)
-                    lastTotalBitsSent[ip][op]=self.totalBitsSent[ip][op]
+            sample=len(self.timeSamples)
+            for pair, bits in self.bitsSinceSample.items():
+                self.bwSamples.setdefault(pair, []).append((sample, bits/self.monitorInterval))
+            idle=not self.bitsSinceSample
+            self.bitsSinceSample={}
 
             self.timeSamples.append(self.env.now)
 
+            nextSample=self.monitorInterval
+            if idle:
+                # nothing forwarded for a whole interval: sleep until the next packet is forwarded
+                nextSample=yield from self.idleWait()
+
+    def addIdleSample(self, time):
+
+        self.timeSamples.append(time)
+
+    def bwSeries(self, inPort, outPort):
+        """returns the list of the bw sampled for a pair of ports, one per time sample"""
+
+        series=[0.0]*len(self.timeSamples)
+        for sample, bw in self.bwSamples.get((inPort, outPort), ()):
+            series[sample]=bw
+        return series
+
+    @property
+    def bw(self):
+        """the lists of sampled bw indexed by [inPort][outPort], built from the samples of the pairs when read"""
+
+        return [[self.bwSeries(ip, op) for op in range(self.outPorts)] for ip in range(self.inPorts)]
+
     def dumpBwVsTime(self):
 
         #returns two lists: one for the time stamps indicating the closure of monitoring interval
         # (in cycles) and another for the recorded bw during that interval
+        self.catchUpMonitor(self.env.now, inclusive=False)
         name=''
         time= [name]+[t/simTicksPerCycle for t in self.timeSamples]
         data=[]
 
-        for ip in range(len(self.totalBitsSent)):
-            for op in range(len(self.totalBitsSent[ip])):
-                adjustedBw=[simTicksPerCycle*b for b in self.bw[ip][op]]
-                if any(adjustedBw):
-                    data.append(['{}/{}'.format(ip,op)]+adjustedBw)
+        for ip, op in sorted(self.bwSamples):
+            data.append(['{}/{}'.format(ip,op)]+[simTicksPerCycle*b for b in self.bwSeries(ip, op)])
 
         return time, data
 
@@ -341,11 +567,21 @@ class Crossbar(Component):
         """returns a list of statistics on the operation: 
                 1- """
 
+        self.catchUpMonitor(self.env.now, inclusive=False)
         avData=[]
         for ip in range(len(self.totalBitsSent)):
             for op in range(len(self.totalBitsSent[ip])):
 
-                maxbw=simTicksPerCycle*max(self.bw[ip][op]) if self.bw[ip][op]!=[] else 0
+                if (ip, op) in self.bwSamples:
+                    bw=self.bwSeries(ip, op)
+                    maxbw=simTicksPerCycle*max(bw)
+                    averagebw2=simTicksPerCycle*mean(bw)
+                    squares=sum([b**2 for b in bw])
+                else:
+                    # no bits sent during any sampled interval: all the samples are 0
+                    maxbw=averagebw2=simTicksPerCycle*0.0 if self.timeSamples else 0
+                    squares=0.0
+
                 firstActivity=self.firstActivity[ip][op] if self.firstActivity[ip][op] else 0
                 lastActivity=self.lastActivity[ip][op] if self.lastActivity[ip][op] else 0
                 totalBitsSent=self.totalBitsSent[ip][op]
@@ -354,46 +590,43 @@ class Crossbar(Component):
                 
                 averagebw0=simTicksPerCycle*(totalBitsSent/activeDuration) if activeDuration else 0
                 averagebw1=simTicksPerCycle*(totalBitsSent/self.env.now)
-                averagebw2=simTicksPerCycle*mean(self.bw[ip][op]) if self.bw[ip][op] else 0
-                averagebw3=(simTicksPerCycle)*(self.monitorInterval*sum([b**2 for b in self.bw[ip][op]]))/totalBitsSent if totalBitsSent else 0
+                averagebw3=(simTicksPerCycle)*(self.monitorInterval*squares)/totalBitsSent if totalBitsSent else 0
 
                 avData.append(['{}/{}'.format(ip,op)]+[round(maxbw,2),round(averagebw0,2),round(averagebw1,2),round(averagebw2,2),round(averagebw3,2),totalBitsSent,int(firstActivity/simTicksPerCycle),int(lastActivity/simTicksPerCycle),int(self.env.now/simTicksPerCycle)])
 
         return avData
 
 class RoundRobinCrossbar(Crossbar):
-    
+
+    electedCode=XBAR_ELECTED_RR
+
     def postDecisionMsg(self,candidate):
 
+        if not self.isLogEnabled('INFO', self.routedPktList[candidate]):
+            return
         inPortName=self.toUp[candidate].name if self.inPorts>1 else self.toUp.name
         outPortName=self.toDn[self.routes[candidate]].name if self.outPorts>1 else self.toDn.name                
-        self.Log("INFO", "RoundRobin Arbitration elected packet {} from {} to proceed towards {}".format(self.routedPktList[candidate].uid, inPortName, outPortName))
-
-    def arbitratePkts(self,pktList,outPort=0):
-
+        self.Log("INFO", "RoundRobin Arbitration elected packet {} from {} to proceed towards {}", self.routedPktList[candidate].uid, inPortName, outPortName,
+            pkt=self.routedPktList[candidate])
 
-        activeports=[i for i, pkt in enumerate(pktList) if pkt != None]
-        # self.Log("DEBUG", "Ports {} are unmasked for outPort {}".format(activeports,outPort))
+    def arbitrateMask(self,mask,outPort=0):
 
-        count=0
-        candidate=(self.lastport[outPort]+1)%self.inPorts
+        candidate=roundRobinWinner(mask, self.lastport[outPort])
 
-        while count<self.inPorts:
-
-            if pktList[candidate]:
-                self.lastport[outPort]=candidate   
+        if candidate!=None:
+            pkt=self.routedPktList[candidate]
+            self.lastport[outPort]=candidate   
+            if self.tracer:
+                self.tracer.record(self, XBAR_ELECTED_RR_UNMASKED, pkt.uid, candidate, outPort|self.tracer.maskId(mask)<<16)
+            if self.isLogEnabled('INFO', pkt):
                 inPortName=self.toUp[candidate].name if self.inPorts>1 else self.toUp.name
                 outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
 
-                unMaskedPorts=[self.toUp[port].name for port in activeports] if self.inPorts>1 else [self.toUp.name]
-                self.Log("INFO", "RoundRobin arbitration between unmasked ports {} elected packet {} from {} to proceed towards {}".format(unMaskedPorts,pktList[candidate].uid, inPortName, outPortName))
-                return candidate
+                unMaskedPorts=[self.toUp[port].name for port in maskPorts(mask)] if self.inPorts>1 else [self.toUp.name]
+                self.Log("INFO", "RoundRobin arbitration between unmasked ports {} elected packet {} from {} to proceed towards {}", unMaskedPorts, pkt.uid, inPortName, outPortName,
+                    pkt=pkt)
 
-            else:
-                count+=1
-                candidate=(candidate+1)%self.inPorts
-
-        return None
+        return candidate
 
 class WeightedRoundRobinCrossbar(Crossbar):
 
@@ -407,49 +640,49 @@ class WeightedRoundRobinCrossbar(Crossbar):
         
         self.grants=[0]*self.inPorts
 
-    def arbitratePkts(self,pktList,outPort=0):
-
-        activeports=[i for i, pkt in enumerate(pktList) if pkt != None]
-
-        count=0
+    def arbitrateMask(self,mask,outPort=0):
 
-        candidate=self.lastport[outPort]
-        decisionMade=False
         selectedCandidate=None
 
-        while count<self.inPorts and not decisionMade:
+        # the ports are visited from the last elected one, which keeps being elected until it used up its weight
+        for candidate in rotatedPorts(mask, self.lastport[outPort]%self.inPorts):
 
-            if pktList[candidate]:
+            decisionMade=False
+            if self.weights[candidate]>self.grants[candidate]:
 
-                if self.weights[candidate]>self.grants[candidate]:
+                selectedCandidate=candidate
+                decisionMade=True
 
-                    selectedCandidate=candidate
-                    decisionMade=True
+            elif selectedCandidate==None:
+                selectedCandidate=candidate
 
-                elif selectedCandidate==None:
-                    selectedCandidate=candidate
+            if self.grants[candidate]==self.weights[candidate]:
+                self.grants[candidate]=0
 
-                if self.grants[candidate]==self.weights[candidate]:
-                    self.grants[candidate]=0
-
-            count=(count+1)
-            candidate=(candidate+1)%self.inPorts
+            if decisionMade:
+                break
 
         if selectedCandidate!=None:
 
+            pkt=self.routedPktList[selectedCandidate]
             self.lastport[outPort]=selectedCandidate
             self.grants[selectedCandidate]+=1
-            inPortName=str((self.toUp[selectedCandidate].name if self.inPorts>1 else self.toUp.name))
-            outPortName=str((self.toDn[outPort].name if self.outPorts>1 else self.toDn.name))
-            unMaskedPorts=[self.toUp[port].name for port in activeports] if self.inPorts>1 else [self.toUp.name]
-            self.Log("INFO", "Weighted RoundRobin arbitration elected packet {} from {} to proceed towards {}".format(pktList[selectedCandidate].uid, inPortName, outPortName))
+            if self.tracer:
+                self.tracer.record(self, XBAR_ELECTED_WRR, pkt.uid, selectedCandidate, outPort)
+            if self.isLogEnabled('INFO', pkt):
+                inPortName=str((self.toUp[selectedCandidate].name if self.inPorts>1 else self.toUp.name))
+                outPortName=str((self.toDn[outPort].name if self.outPorts>1 else self.toDn.name))
+                self.Log("INFO", "Weighted RoundRobin arbitration elected packet {} from {} to proceed towards {}", pkt.uid, inPortName, outPortName,
+                    pkt=pkt)
 
             return selectedCandidate
 
         return None
 
 class FixedPriorityCrossbar(Crossbar):
-    
+
+    electedCode=XBAR_ELECTED_FP
+
     def __init__(self, env, name="", parent=None, inPorts=2,outPorts=1,priorities=None,pushMode=False,monitorBW=False, monitorInterval=500):
         Crossbar.__init__(self,env, name, parent, inPorts,outPorts,pushMode,monitorBW, monitorInterval)
 
@@ -468,45 +701,50 @@ class FixedPriorityCrossbar(Crossbar):
             self.Log("FATAL_ERROR","the number of priorities provided must be equal to the number of inPorts")
         
         self.lastportPerClass=[]
+        self.classMasks=[0]*self.priorityClasses #bitmask of the inPorts of each priority class
 
         for priorityClass in range(self.priorityClasses):
             self.lastportPerClass.append([-1]*self.outPorts)
+
+        for port, priority in enumerate(self.priorities):
+            self.classMasks[priority]|=1<<port
     
     def postDecisionMsg(self,candidate):
 
-        inPortName=self.toUp[selectedCandidatedate].name if self.inPorts>1 else self.toUp.name
+        if not self.isLogEnabled('INFO', self.routedPktList[candidate]):
+            return
+        inPortName=self.toUp[candidate].name if self.inPorts>1 else self.toUp.name
         outPortName=self.toDn[self.routes[candidate]].name if self.outPorts>1 else self.toDn.name                
-        self.Log("INFO", "FixedPriority Arbitration elected packet {} from {} to proceed towards {}".format(self.routedPktList[candidate].uid, inPortName, outPortName))
-
-    def arbitratePkts(self,pktList,outPort=0):
-
-        activeports=[i for i, pkt in enumerate(pktList) if pkt != None]
-
-        self.Log("DEBUG", "Ports {} are unmasked for outPort {}".format(activeports,outPort))
-        maxpriority=max([self.priorities[port] for port in activeports])
-
-        for port in activeports:
-            if self.priorities[port]<maxpriority:
-                pktList[port]=None
-
-        count=0
-        candidate=(self.lastportPerClass[maxpriority][outPort]+1)%self.inPorts
-
-        while count<self.inPorts:
-
-            if pktList[candidate]:
-                self.lastportPerClass[maxpriority][outPort]=candidate   
-                self.lastport[outPort]=candidate 
+        self.Log("INFO", "FixedPriority Arbitration elected packet {} from {} to proceed towards {}", self.routedPktList[candidate].uid, inPortName, outPortName,
+            pkt=self.routedPktList[candidate])
+
+    def arbitrateMask(self,mask,outPort=0):
+
+        if self.tracer:
+            self.tracer.record(self, XBAR_PORTS_UNMASKED, value=outPort|self.tracer.maskId(mask)<<16)
+        if self.isLogEnabled('DEBUG'):
+            self.Log("DEBUG", "Ports {} are unmasked for outPort {}", maskPorts(mask), outPort)
+
+        # only the ports of the highest priority class with unmasked packets take part in the round robin
+        maxpriority=self.priorityClasses-1
+        while maxpriority>0 and not mask&self.classMasks[maxpriority]:
+            maxpriority-=1
+
+        candidate=roundRobinWinner(mask&self.classMasks[maxpriority], self.lastportPerClass[maxpriority][outPort])
+
+        if candidate!=None:
+            pkt=self.routedPktList[candidate]
+            self.lastportPerClass[maxpriority][outPort]=candidate   
+            self.lastport[outPort]=candidate 
+            if self.tracer:
+                self.tracer.record(self, XBAR_ELECTED_FP_UNMASKED, pkt.uid, candidate, outPort|self.tracer.maskId(mask)<<16)
+            if self.isLogEnabled('INFO', pkt):
                 inPortName=self.toUp[candidate].name if self.inPorts>1 else self.toUp.name
                 outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
-                unMaskedPorts=[self.toUp[port].name for port in activeports] if self.inPorts>1 else [self.toUp.name]
-
-                self.Log("INFO", "Fixed Priority arbitration between unmasked ports {} elected packet {} from {} to proceed towards {}".format(unMaskedPorts,pktList[candidate].uid, inPortName, outPortName))
-                return candidate
+                unMaskedPorts=[self.toUp[port].name for port in maskPorts(mask)] if self.inPorts>1 else [self.toUp.name]
 
-            else:
-                count+=1
-                candidate=(candidate+1)%self.inPorts
+                self.Log("INFO", "Fixed Priority arbitration between unmasked ports {} elected packet {} from {} to proceed towards {}", unMaskedPorts, pkt.uid, inPortName, outPortName,
+                    pkt=pkt)
 
-        return None
+        return candidate
 
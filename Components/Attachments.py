@@ -62,6 +62,7 @@ class TrafficSink(Unit):
             self.Log("DEBUG","Extracted packet {} from {}".format(pkt.uid,self.toUp.name))
             self.updateReceivedBytes(pkt)
             self.totalBitsSent+=pkt.getBytes()*8
+            self.wakeMonitor()
             yield self.env.timeout(pkt.getTicks(self.bytesPerTick)*simTicksPerCycle)
             self.Log("DEBUG","Received {} out of {} expected bytes".format(self.receivedBytes,self.expectedBytes))
 
@@ -84,12 +85,22 @@ class TrafficSink(Unit):
     def bwMonitor(self):
         lastTotalBitsSent = 0
         bw_interval = 0
+        nextSample = self.monitorInterval
         while True:
-            yield self.env.timeout(self.monitorInterval)
+            yield self.env.timeout(nextSample)
+            idle = self.totalBitsSent==lastTotalBitsSent
             bw_interval = (self.totalBitsSent - lastTotalBitsSent) / self.monitorInterval
             self.bw.append(bw_interval)
             self.timeSamples.append(self.env.now)
             lastTotalBitsSent = self.totalBitsSent
+            nextSample = self.monitorInterval
+            if idle:
+                # nothing received for a whole interval: sleep until the next packet is received
+                nextSample = yield from self.idleWait()
+
+    def addIdleSample(self, time):
+        self.bw.append(0.0)
+        self.timeSamples.append(time)
 
 
 
@@ -3,6 +3,170 @@
     with the helper tools to connect components and units"""
 
 import logging
+import random
+from collections import OrderedDict
+from SimSettings import masterSeed
+
+class LogFilter(object):
+
+    """Registry of the packets and components whose INFO and DEBUG messages are output, to follow a few packets
+        or a corner of a large model at DEBUG level without logging everything. FATAL_ERROR and WARNING messages
+        are never filtered out.
+
+        Once the filter is installed, an INFO/DEBUG message is only output if the component logging it is selected
+        by a fullname prefix, or if the message passes the packet it relates to (the pkt argument of Log()) and the
+        packet is selected, either by its uid or by one of the predicates. The prefix match of every component is
+        cached, so the check done at the log sites is a dictionary lookup. The verdict of the predicates is cached
+        by uid for the last cacheSize packets seen (least recently used first out), so the predicates are usually
+        called once per packet while the memory used stays bounded however many packets go through the platform.
+
+        Arguments:
+           * cacheSize (int): the number of packets whose predicate verdict is cached
+
+        Variables:
+           * uids (set): the uids of the selected packets
+           * predicates (list): functions taking a packet and returning True if it is selected
+           * prefixes (list): the fullname prefixes of the selected components
+
+        Methods:
+           * addUids(*uids), addPredicate(predicate), addPrefixes(*prefixes): select more packets or components
+           * install(), uninstall(): make the filter the one applied by all the components, or remove it
+           * selects(component, pkt): True if the messages of the component about pkt are output
+
+        usage:
+           LogFilter(uids=[42]).install()
+           LogFilter(predicates=[lambda pkt: pkt.f['destProc']==3], prefixes=['RingOf6.Router3']).install()
+           LogFilter.uninstall()
+    """
+
+    def __init__(self, uids=(), predicates=(), prefixes=(), cacheSize=4096):
+
+        self.uids=set()
+        self.predicates=[]
+        self.prefixes=[]
+        self.cacheSize=cacheSize
+        self.selectedPkts=OrderedDict()
+        self.selectedComponents={}
+        self.addUids(*uids)
+        for predicate in predicates:
+            self.addPredicate(predicate)
+        self.addPrefixes(*prefixes)
+
+    def addUids(self, *uids):
+
+        # packet uids are strings, accept them as numbers too
+        self.uids.update(str(uid) for uid in uids)
+
+    def addPredicate(self, predicate):
+
+        self.predicates.append(predicate)
+        self.selectedPkts.clear()
+
+    def addPrefixes(self, *prefixes):
+
+        self.prefixes.extend(prefixes)
+        self.selectedComponents.clear()
+
+    def install(self):
+
+        ComponentBase.logFilter=self
+        return self
+
+    @staticmethod
+    def uninstall():
+
+        ComponentBase.logFilter=None
+
+    def selects(self, component, pkt=None):
+
+        selected=self.selectedComponents.get(component.fullname)
+        if selected is None:
+            selected=self.selectedComponents[component.fullname]=any(component.fullname.startswith(prefix) for prefix in self.prefixes)
+        if selected or pkt is None:
+            return selected
+
+        if pkt.uid in self.uids:
+            return True
+        if not self.predicates:
+            return False
+
+        selectedPkts=self.selectedPkts
+        selected=selectedPkts.get(pkt.uid)
+        if selected is None:
+            selected=selectedPkts[pkt.uid]=any(predicate(pkt) for predicate in self.predicates)
+            if len(selectedPkts)>self.cacheSize:
+                selectedPkts.popitem(last=False)
+        else:
+            selectedPkts.move_to_end(pkt.uid)
+        return selected
+
+class LogMessage(object):
+
+    """The msg of the log records of the components: the time, the fullname of the component, the message template
+        and its arguments, rendered into '[@time]fullname : message' only when a handler needs the text (str() or
+        record.getMessage()). Handlers that count or filter messages may use the template, which is the same for
+        all the messages logged by a given Log() call, without rendering anything.
+
+        Variables:
+           * time (int): the simulation time of the message
+           * fullname (string): the fullname of the component logging the message
+           * template (string): the msg argument of Log()
+           * args (tuple): the arguments the template is formatted with, none if it is already formatted
+           * infolist (list): the additional lines passed to Log(), if any
+    """
+
+    __slots__=('time', 'fullname', 'template', 'args', 'infolist')
+
+    def __init__(self, time, fullname, template, args=(), infolist=None):
+
+        self.time=time
+        self.fullname=fullname
+        self.template=template
+        self.args=args
+        self.infolist=infolist
+
+    def __str__(self):
+
+        text='[@%d]%s : %s' % (self.time, self.fullname, self.template.format(*self.args) if self.args else self.template)
+        if self.infolist:
+            text+='\n\tInfodump follows:'+''.join('\n\t%s' % item for item in self.infolist)
+        return text
+
+class LogCounter(logging.Handler):
+
+    """Logging handler counting the messages of the components per (fullname, template), without rendering them.
+        It counts the messages that are output, ie enabled by the logger levels and selected by the LogFilter
+
+        usage:
+           counter=LogCounter()
+           logging.getLogger().addHandler(counter)
+           env.run(until=10000)
+           counter.count('Arbitration is re-scheduled for the next cycle') -> {fullname: count}
+    """
+
+    def __init__(self, level=logging.NOTSET):
+
+        logging.Handler.__init__(self, level)
+        self.counts={}
+
+    def emit(self, record):
+
+        msg=record.msg
+        key=(msg.fullname, msg.template) if isinstance(msg, LogMessage) else (record.name, msg)
+        self.counts[key]=self.counts.get(key, 0)+1
+
+    def count(self, template):
+        """returns a dictionary {fullname: count} of the messages logged with a template"""
+
+        return {fullname:count for (fullname, t), count in self.counts.items() if t==template}
+
+    def templates(self):
+        """returns a list of (count, template) of all the templates logged, most frequent first"""
+
+        totals={}
+        for (fullname, template), count in self.counts.items():
+            totals[template]=totals.get(template, 0)+count
+        return sorted(((count, template) for template, count in totals.items()), reverse=True)
 
 class ComponentBase(object):
 
@@ -13,27 +177,68 @@ class ComponentBase(object):
            * name (string): the name of the component/unit
            * parent (object) : points to the parent component/unit if this is a sub-component, None if not
            * fullname (string): point separated hierarchy of the component (family tree)
+           * children (list): the components/units created with this one as their parent
+           * masterSeed: the seed of the platform, inherited from the parent (SimSettings.masterSeed for a top-level unit)
+           * rng (random.Random): the random stream of the component, seeded from masterSeed and fullname so that the
+                draws of a component do not depend on the other components nor on the process it runs in
            * action (simpy.Event): variable storing a reference to the action taken by the component
                 when simulation starts
            * logger: instane of the logging.getLogger() to make is simple to add logs for debug
-        
+           * tracer (TraceRecorder): the binary trace recorder the component writes its events to, None if not traced
+           * traceId (int): the id of the component in the trace of its tracer
+           * pathRecorder (PathRecorder): the recorder of the packet hops through the component, None if not recorded
+           * pathId (int): the id of the component in its pathRecorder
+           * vcd (VcdWriter): the VCD writer the component writes its signal changes to, None if not dumped
+           * deadlockWatchdog (DeadlockWatchdog): the watchdog watching the component, which the component wakes when
+                a packet starts waiting in it, None if not watched
+           * logFilter (LogFilter): the filter selecting the INFO/DEBUG messages output by all the components, None
+                to output them all. Set by LogFilter.install()
+           * runFilter (function): set on ComponentBase while a platform is built, a function taking a component and
+                returning False if its run() must not be started (eg components simulated by another partition of a
+                ParallelRunner). None to start the run() of all the components
+
         Methods:
            * __init__() : initialize the component using environment,name and parent
            * run()      : the code that runs when simulation begins, customizable, by default it does nothing and is done
                         after 1 tick. This will be customized for the purpose of the system being simulated
            * Log()      : helper function that allows simple logging by setting message type and the message
+           * isLogEnabled(msgtype, pkt): True if messages of the given type are output, to skip building costly log arguments
            * setLogLevel(l): sets the log level existing in the python logging package to control how much info
                              the user wants in the log files (eg INFO, DEBUG, ERROR)
+           * walk()     : iterates over the component/unit and all the components/units below it in the hierarchy
+           * setMasterSeed(seed): reseeds the random streams of the component/unit and all the ones below it
+           * registerSignals(vcd): declares the signals of the component to a VcdWriter, customizable, none by default
+           * monitorSleep(), wakeMonitor(), catchUpMonitor(): let a periodic monitor (eg bwMonitor) stop waking up
+                          while the component is idle and backfill the samples it skipped
+           * idleWait(): the sleep of a periodic monitor through an idle period, monitorSleep() then catchUpMonitor()
     """
 
 
+    logLevels={'FATAL_ERROR':logging.ERROR, 'WARNING':logging.WARNING, 'INFO':logging.INFO, 'DEBUG':logging.DEBUG}
+    tracer=None
+    traceId=-1
+    pathRecorder=None
+    pathId=-1
+    vcd=None
+    deadlockWatchdog=None
+    logFilter=None
+    runFilter=None
+
     def __init__(self, env, name, parent=None):
 
         self.env = env
         self.name = name
         self.parent=parent
         self.fullname = (parent.fullname + "."  if parent!=None else "") + name
-        self.action = self.env.process(self.run())
+        self.children=[]
+        if parent!=None:
+            parent.children.append(self)
+        self.masterSeed=parent.masterSeed if parent!=None else masterSeed
+        self.rng=random.Random('{}/{}'.format(self.masterSeed, self.fullname))
+        self.monitorWake=None
+        self.lastMonitorSample=None
+        runFilter=ComponentBase.runFilter
+        self.action = self.env.process(self.run()) if runFilter is None or runFilter(self) else None
         self.logger = logging.getLogger(self.fullname)
 
     def run(self):
@@ -41,51 +246,145 @@ class ComponentBase(object):
         """Dummy simpy run function for the base class; completes after one time simpy tick"""
         yield self.env.timeout(1)
 
-    def Log(self, msgtype, msg, pkt=None, infolist=None):
+    def Log(self, msgtype, msg, *args, pkt=None, infolist=None):
 
         """Common logging function used by all components/units classes
 
         Arguments:
            msgtype(string) : One of 'FATAL_ERROR', 'WARNING', INFO', 'DEBUG'
            msg(string)     : The message to be logged, specified by the component
+           args            : If any, msg is a format string rendered with msg.format(*args). The message is only
+                             rendered by the handlers that need its text (see LogMessage), so hot paths should pass
+                             their arguments rather than a formatted message, and not modify them afterwards.
+                             A msg without any {} placeholder keeps the former signature Log(msgtype, msg, pkt,
+                             infolist): its args are taken as pkt and infolist
            pkt(ElPktHdr)   : Packet related messages may pass the packet concerned in order to enable
-                             packet info message filtering
+                             packet info message filtering (see LogFilter)
            infolist(list)  : Some messages may pass this list of strings as arbitrary additional debug
                              info to be logged"""
 
-        # construct the output from the current sim time, objects full pathname and the passed message
-        fullmsg = '[@%d]%s : %s' % (self.env.now, self.fullname, msg)
-        displayinfo = True
+        if msgtype not in self.logLevels:
+            raise RuntimeError("ERROR: Unsupported message type [%s] in %s " % (msgtype, self.fullname))
+
+        # nothing is rendered for a suppressed message
+        if not self.logger.isEnabledFor(self.logLevels[msgtype]):
+            return
+
+        # callers of the former signature pass pkt and infolist positionally after an already formatted message
+        if args and '{' not in msg:
+            if len(args)>2 or pkt is not None or infolist is not None:
+                raise RuntimeError("ERROR: Unexpected arguments {} for the message [{}] in {}".format(args, msg, self.fullname))
+            pkt, infolist=(args+(None,))[:2]
+            args=()
 
+        # info and debug messages can be suppressed according to packet id or component
+        displayinfo = self.logFilter is None or msgtype in ('FATAL_ERROR', 'WARNING') or self.logFilter.selects(self, pkt)
+        if not displayinfo:
+            return
+
+        # the output is built from the current sim time, objects full pathname and the passed message
+        # by the handlers that need the text, the record only holds the template and its arguments
+        # some messages pass a list of strings which provides more debug info relating to the message
+        record = LogMessage(self.env.now, self.fullname, msg, args, infolist)
 
         # always output the message if it is an error message or warning
         if msgtype == 'FATAL_ERROR':
-            self.logger.error(fullmsg)
+            self.logger.error(record)
         elif msgtype == 'WARNING':
-            self.logger.warning(fullmsg)
+            self.logger.warning(record)
         elif msgtype == 'INFO':
-            # info messages can be suppressed according to packet id
-            if displayinfo:
-                self.logger.info(fullmsg)
+            self.logger.info(record)
         elif msgtype == 'DEBUG':
-            self.logger.debug(fullmsg)
-        else:
-            raise RuntimeError("ERROR: Unsupported message type [%s] in %s " % (msgtype, self.fullname))
-
-        # some messages pass a list of strings which provides more debug info relating to the message
-        # if this argument is present, print out the strings (unless message is being suppressed)
-        if infolist and displayinfo:
-            self.logger.info("\tInfodump follows:")
-            for item in infolist:
-                self.logger.info("\t%s" % item)
+            self.logger.debug(record)
 
         # finally, if the message was an error, raise an exception.
         if 'ERRROR' in msgtype:
-            raise RuntimeError(fullmsg)
+            raise RuntimeError(str(record))
+
+    def isLogEnabled(self, msgtype, pkt=None):
+
+        """Returns True if messages of type msgtype (about the packet pkt if given) are output by the component.
+        Callers use it to skip building the arguments of a message that would be suppressed. The check is cached by
+        the component logger, whose cache the logging module clears whenever a level is changed"""
+
+        return self.logger.isEnabledFor(self.logLevels[msgtype]) and \
+            (self.logFilter is None or msgtype in ('FATAL_ERROR', 'WARNING') or self.logFilter.selects(self, pkt))
 
     def setLogLevel(self,level):
         self.logger.setLevel(level)
 
+    def monitorSleep(self):
+
+        """Returns an event that a periodic monitor waits on, instead of its next timeout, once the component
+        has been idle for a whole monitoring interval. The event is triggered by wakeMonitor(), which the component
+        calls whenever it records some activity. Monitors taking samples use it through idleWait()"""
+
+        self.lastMonitorSample=self.env.now
+        self.monitorWake=self.env.event()
+        return self.monitorWake
+
+    def idleWait(self):
+
+        """Sleeps until wakeMonitor() is called, backfills the samples of the intervals slept through and returns the
+        delay until the next sample. Usage inside a periodic monitor, right after taking a sample that shows no activity:
+
+            nextSample=yield from self.idleWait()
+            yield self.env.timeout(nextSample)"""
+
+        yield self.monitorSleep()
+        self.catchUpMonitor(self.env.now)
+        nextSample=self.lastMonitorSample+self.monitorInterval-self.env.now
+        self.lastMonitorSample=None
+        return nextSample
+
+    def wakeMonitor(self):
+
+        if self.monitorWake is not None:
+            self.monitorWake.succeed()
+            self.monitorWake=None
+
+    def catchUpMonitor(self, until, inclusive=True):
+
+        """Calls addIdleSample(t) for every monitoring interval that closed at a time t while the monitor was asleep,
+        up to until. Samples closing exactly at until are only added if inclusive is True. Does nothing if the monitor
+        is awake."""
+
+        if self.lastMonitorSample is None:
+            return
+
+        while self.lastMonitorSample+self.monitorInterval<until or \
+              (inclusive and self.lastMonitorSample+self.monitorInterval==until):
+            self.lastMonitorSample+=self.monitorInterval
+            self.addIdleSample(self.lastMonitorSample)
+
+    def addIdleSample(self, time):
+
+        """Appends the samples of a monitoring interval with no activity closing at the given time. To be customized
+        by components with a periodic monitor"""
+
+        pass
+
+    def setMasterSeed(self, seed):
+
+        for component in self.walk():
+            component.masterSeed=seed
+            component.rng.seed('{}/{}'.format(seed, component.fullname))
+
+    def registerSignals(self, vcd):
+
+        """Declares the signals the component dumps with vcd.signal() when it is attached to a VcdWriter. To be
+        customized by components with signals, which then call self.vcd.change() whenever one of them changes"""
+
+        pass
+
+    def walk(self):
+
+        """Generator over the component/unit itself followed by all its descendants (depth first)"""
+
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
 class Component(ComponentBase):
 
     """A Generic class defining a smallest connectable entity. It inherits from the ComponentBase class.
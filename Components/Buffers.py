@@ -1,5 +1,6 @@
 from Components.BasicComponent import Component
-from simpyExtensions.util import NewEvent, BufferPut, BufferGet, BufferPeek
+from simpyExtensions.util import NewEvent, BufferPut, BufferGet, BufferPeek, EventPool
+from simpyExtensions.trace import BUFFER_PUT, BUFFER_GET_REQUEST, BUFFER_GET, BUFFER_PEEK_REQUEST
 from simpy.resources.store import Store, StorePut
 from SimSettings import simTicksPerCycle
 from statistics import mean
@@ -65,6 +66,10 @@ class Buffer(Component, Store):
 
         Store.__init__(self,env,capacity)
         self.peek_queue=[]
+        self.putPool=EventPool(env,BufferPut)
+        self.getPool=EventPool(env,BufferGet)
+        self.peekPool=EventPool(env,BufferPeek)
+        self.eventPool=EventPool(env,NewEvent)
         self.putDelay=putDelay
         self.getDelay=getDelay
         self.putDebt=0
@@ -109,6 +114,10 @@ class Buffer(Component, Store):
 
         yield self.env.timeout(1)
 
+    def registerSignals(self, vcd):
+
+        self.occupancySignal=vcd.signal(self, 'occupancy', max(self.capacity.bit_length(), 1), len(self.items))
+
     def occupiedSlots(self,seg=None):
 
         return len(self.items)
@@ -166,12 +175,14 @@ class Buffer(Component, Store):
         lastTotalWrBits = 0
         lastTotalRdBits = 0
         bw_interval = 0
+        nextSample = self.monitorInterval
 
 
         while True:
 
-            yield self.env.timeout(self.monitorInterval)
+            yield self.env.timeout(nextSample)
             self.timeSamples.append(self.env.now)
+            idle = self.totalWrBits==lastTotalWrBits and self.totalRdBits==lastTotalRdBits
 
             bw_interval = (self.totalWrBits - lastTotalWrBits) / (self.monitorInterval)
             self.wrBw.append(bw_interval)
@@ -181,6 +192,17 @@ class Buffer(Component, Store):
             self.rdBw.append(bw_interval)
             lastTotalRdBits=self.totalRdBits
 
+            nextSample = self.monitorInterval
+            if idle:
+                # nothing written or read for a whole interval: sleep until the next activity
+                nextSample = yield from self.idleWait()
+
+    def addIdleSample(self, time):
+
+        self.timeSamples.append(time)
+        self.wrBw.append(0.0)
+        self.rdBw.append(0.0)
+
     def dumpBwVsTime(self):
         """this function dumps time series data about the writing bandwidth into the 
             buffer. The output is two lists:
@@ -192,6 +214,7 @@ class Buffer(Component, Store):
 
             The values are adjusted for the simTicksPerCycle so the time is in hardware cycles and the bandwidth is in Gbps"""
 
+        self.catchUpMonitor(self.env.now, inclusive=False)
         prefix=''
 
         time= [prefix]+[t/simTicksPerCycle for t in self.timeSamples]
@@ -217,6 +240,7 @@ class Buffer(Component, Store):
             The values are adjusted for the simTicksPerCycle so the time is in hardware cycles and the bandwidth is in Gbps"""
 
 
+        self.catchUpMonitor(self.env.now, inclusive=False)
         name=''
         stats=[]
         maxbw=simTicksPerCycle*max(self.wrBw) if self.wrBw!=[] else 0
@@ -303,7 +327,9 @@ class Buffer(Component, Store):
                    in the buffer.
                 5- finally the method returns the BufferPut event
             """
-        return BufferPut(self,item,caller)
+        if self.deadlockWatchdog:
+            self.deadlockWatchdog.wakeMonitor()
+        return self.putPool.acquire(self,item,caller)
 
     def addPrePutDelay(self, item):
         """ This function adds a put delay before an item is actually appended into
@@ -332,7 +358,8 @@ class Buffer(Component, Store):
             THEN;
              2- the number of ticks returned by this function has passed"""
 
-        self.Log('INFO', "Started writing packet {} into the buffer. This will take {} ticks".format(item.uid,self.addPostPutDelay(item)))
+        if self.isLogEnabled('INFO', item):
+            self.Log('INFO', "Started writing packet {} into the buffer. This will take {} ticks", item.uid, self.addPostPutDelay(item), pkt=item)
 
     def _do_put(self, event):
 
@@ -342,8 +369,8 @@ class Buffer(Component, Store):
             event.callbacks.append(self._updateTotalWrBits)
 
             if preputdelay:
-                ev=NewEvent(self.env,item=event.item)
-                ev.callbacks+=[self._insert_packet,self._trigger_get,self._trigger_peek]
+                ev=self.eventPool.acquire(self.env,item=event.item)
+                ev.callbacks+=[self._insert_packet,self._trigger_get,self._trigger_peek,ev.recycle]
                 ev.succeed(delay=preputdelay)
                 event.succeed(delay=postputdelay)
 
@@ -367,6 +394,12 @@ class Buffer(Component, Store):
 
         self.items.append(event.item)
 
+        if self.tracer:
+            self.tracer.record(self, BUFFER_PUT, event.item.uid, value=self.addPostPutDelay(event.item))
+        if self.pathRecorder:
+            self.pathRecorder.enter(self, event.item)
+        if self.vcd:
+            self.vcd.change(self.occupancySignal, len(self.items))
         self.postPutMsg(event.item)
 
     def _putBusy(self,*args):
@@ -384,6 +417,7 @@ class Buffer(Component, Store):
     def _updateTotalWrBits(self,event):
         
         self.totalWrBits += event.item.getBytes()*8
+        self.wakeMonitor()
 
 
     def get(self,item=None,caller=None):
@@ -425,13 +459,15 @@ class Buffer(Component, Store):
                     yield self.env.process(buffer.get())
 
         """
+        if self.tracer:
+            self.tracer.record(self, BUFFER_GET_REQUEST, port=self.tracer.componentId(caller) if caller else -1)
         if caller:
-            self.Log("DEBUG","Read request initiated by {}".format(caller.name))
+            self.Log("DEBUG","Read request initiated by {}", caller.name)
         else:
 
             self.Log("DEBUG","Read request initiated")
 
-        return BufferGet(self,item,caller)
+        return self.getPool.acquire(self,item,caller)
 
     def addPreGetDelay(self, item):
         """ This function adds a get delay after an item has been poped out
@@ -462,7 +498,8 @@ class Buffer(Component, Store):
              1- the item has been popped out of the store, ie, store.items.pop(0)
              2- the number of ticks returned by this function has passed"""
 
-        self.Log( 'INFO', "Started reading packet {} from the buffer. This will take {} ticks".format(item.uid,self.addPostGetDelay(item)))
+        if self.isLogEnabled('INFO', item):
+            self.Log( 'INFO', "Started reading packet {} from the buffer. This will take {} ticks", item.uid, self.addPostGetDelay(item), pkt=item)
 
     def _do_get(self, event):
 
@@ -486,11 +523,18 @@ class Buffer(Component, Store):
     def _remove_packet(self,event):
 
         item=self.items.pop(0)
+        if self.tracer:
+            self.tracer.record(self, BUFFER_GET, item.uid, value=self.addPostGetDelay(item))
+        if self.pathRecorder:
+            self.pathRecorder.leave(self, item)
+        if self.vcd:
+            self.vcd.change(self.occupancySignal, len(self.items))
         self.postGetMsg(item)
 
     def _updateTotalRdBits(self,event):
         
         self.totalRdBits += event.value.getBytes()*8
+        self.wakeMonitor()
 
     def _updateGetDebt(self,item):
 
@@ -501,13 +545,15 @@ class Buffer(Component, Store):
 
     def peek(self, item=None,caller=None):
 
+        if self.tracer:
+            self.tracer.record(self, BUFFER_PEEK_REQUEST, port=self.tracer.componentId(caller) if caller else -1)
         if caller:
-            self.Log("DEBUG","Peek request initiated by {}".format(caller.name))
+            self.Log("DEBUG","Peek request initiated by {}", caller.name)
         else:
 
             self.Log("DEBUG","Peek request initiated")
 
-        return BufferPeek(self, item, caller)
+        return self.peekPool.acquire(self, item, caller)
 
     def _trigger_peek(self,*args) -> None:
         """Trigger peek events.
@@ -580,8 +626,7 @@ class FlowControlledBuffer(Buffer):
 
     def _remove_packet(self,event):
 
-        item=self.items.pop(0)
-        self.postGetMsg(item)
+        Buffer._remove_packet(self, event)
         self.toUp.putCredit()
 
 class StoreAndForwardBuffer(Buffer):
@@ -605,8 +650,25 @@ class CreditBuffer(Component, Store):
         Component.__init__(self, env, name, parent)
         Store.__init__(self,env,initCredits)
         self.peek_queue=[]
+        self.peekPool=EventPool(env,BufferPeek)
         self.items=[1]*initCredits
 
+    def registerSignals(self, vcd):
+
+        self.creditSignal=vcd.signal(self, 'credits', max(self.capacity.bit_length(), 1), len(self.items))
+
+    def _do_put(self, event):
+
+        Store._do_put(self, event)
+        if self.vcd:
+            self.vcd.change(self.creditSignal, len(self.items))
+
+    def _do_get(self, event):
+
+        Store._do_get(self, event)
+        if self.vcd:
+            self.vcd.change(self.creditSignal, len(self.items))
+
     def put(self,item):
 
         storePut=StorePut(self,item)
@@ -616,7 +678,7 @@ class CreditBuffer(Component, Store):
 
     def peek(self,thresh=1):
 
-        return BufferPeek(self,thresh)
+        return self.peekPool.acquire(self,thresh)
 
     def _trigger_peek(self,*args) -> None:
         """Trigger peek events.
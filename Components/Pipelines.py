@@ -1,7 +1,10 @@
 from Components.BasicComponent import Component
-from simpyExtensions.util import NewEvent, PipelinePut
+from simpyExtensions.util import NewEvent, PipelinePut, EventPool
+from simpyExtensions.trace import PIPELINE_PUT, PIPELINE_SENT, CREDIT_RECEIVED, CREDIT_DISPATCHED, CREDIT_CONSUMED
 from Components.Buffers import CreditBuffer
 from SimSettings import simTicksPerCycle
+from statistics import mean
+from collections import deque
 #-----------------------------------------------------------------
 #Generic Pipeline, Flow Controlled Pipeline
 #-----------------------------------------------------------------
@@ -19,8 +22,18 @@ class Pipeline(Component):
     the item will hog the pipeline for. THIS IS DIFFERENT THAN THE TIME TAKEN TO REACH THE
     END OF THE PIPELINE (that is given by the depth parameter)
 
+    Packets travelling down the pipeline are kept in the :attr:`inFlight` queue as (arrival tick, packet)
+    pairs, in order of arrival. A single scheduled delivery event per pipeline puts them into the
+    downstream component when they reach the end of the pipeline.
+
+    When the downstream component is simulated elsewhere (eg by another partition of a ParallelRunner),
+    :meth:`setRemoteLaunch()` makes the pipeline hand the packets it launches to a function instead of
+    delivering them.
+
     """
 
+    remoteLaunch=None
+
     def __init__(self, env, name, parent=None, depth=1, putBytesPerCycle=16,monitorBW=False,monitorInterval=250):
 
         Component.__init__(self,env, name, parent)
@@ -31,6 +44,9 @@ class Pipeline(Component):
         self.depth = depth
         """Queue of pending *put* requests."""
         self.put_queue = []
+        self.inFlight=deque()
+        self.deliveryEvent=None
+        self.eventPool=EventPool(env,NewEvent)
         self.putDebt=0
         self.monitorBW=monitorBW
         self.monitorInterval=monitorInterval*simTicksPerCycle
@@ -50,8 +66,14 @@ class Pipeline(Component):
         """Request to put something into the resource and return a
         :class:`Put` event, which gets triggered once the request
         succeeds."""
+        if self.deadlockWatchdog:
+            self.deadlockWatchdog.wakeMonitor()
         return PipelinePut(self, item, caller=caller)
 
+    def registerSignals(self, vcd):
+
+        self.busySignal=vcd.signal(self, 'busy', 1, 0)
+
     def addPostPutDelay(self,item):
 
         ticks,debt=item.getTicks(self.putBytesPerCycle)
@@ -68,7 +90,8 @@ class Pipeline(Component):
             THEN;
              2- the number of ticks returned by this function has passed"""
 
-        self.Log( 'INFO', "Started sending packet {} down the pipeline. This will take {} simTicks".format(event.item.uid,self.addPostPutDelay(event.item)))
+        if self.isLogEnabled('INFO', event.item):
+            self.Log( 'INFO', "Started sending packet {} down the pipeline. This will take {} simTicks", event.item.uid, self.addPostPutDelay(event.item), pkt=event.item)
 
     def postPutMsg(self, event):
 
@@ -79,7 +102,27 @@ class Pipeline(Component):
             THEN;
              2- the number of ticks returned by this function has passed"""
 
-        self.Log( 'INFO', "Finished sending Packet {} down the pipeline".format(event.item.uid))
+        self.Log( 'INFO', "Finished sending Packet {} down the pipeline", event.item.uid, pkt=event.item)
+
+    def _startPut(self, event):
+        """records the start of a put (trace, packet path, busy waveform) whatever prePutMsg() logs"""
+
+        if self.tracer:
+            self.tracer.record(self, PIPELINE_PUT, event.item.uid, value=self.addPostPutDelay(event.item))
+        if self.pathRecorder:
+            self.pathRecorder.enter(self, event.item)
+        if self.vcd:
+            self.vcd.change(self.busySignal, 1)
+        self.prePutMsg(event)
+
+    def _finishPut(self, event):
+        """records the end of a put (trace, busy waveform) whatever postPutMsg() logs"""
+
+        if self.tracer:
+            self.tracer.record(self, PIPELINE_SENT, event.item.uid)
+        if self.vcd:
+            self.vcd.change(self.busySignal, 0)
+        self.postPutMsg(event)
 
 
     def _putBusy(self,*args):
@@ -93,12 +136,60 @@ class Pipeline(Component):
 
         self.putBusy=False
 
-    def _putdelay(self,item):
+    def setRemoteLaunch(self, send):
+        """Makes the pipeline call send(item, launchTime) for every item it launches instead of delivering
+            it downstream, None to deliver the items again"""
+
+        self.remoteLaunch=send
+
+    def _launch(self,item,launchTime=None):
+        """Sends the item down the pipeline. It is put into the downstream component once
+            its first flit reaches the end of the pipeline, depth cycles after launchTime (now by default)"""
+
+        if self.remoteLaunch:
+            self.remoteLaunch(item, launchTime)
+            return
 
         if not hasattr(self.toDn,'put'):
             self.Log("FATAL_ERROR","{} has no put method")
-        yield self.env.timeout(self.depth*simTicksPerCycle) #time for first flit to be received
-        yield self.toDn.put(item) # writing the packet into downstream
+
+        launchTime=self.env.now if launchTime is None else launchTime
+        self.inFlight.append((launchTime+self.depth*simTicksPerCycle,item))
+
+        if not self.deliveryEvent:
+            self._scheduleDelivery()
+
+    def _scheduleDelivery(self):
+
+        arrival,item=self.inFlight[0]
+        self.deliveryEvent=self.eventPool.acquire(self.env)
+        self.deliveryEvent.callbacks+=[self._deliver,self.deliveryEvent.recycle]
+        self.deliveryEvent.succeed(delay=arrival-self.env.now)
+
+    def _deliver(self,event):
+
+        self.deliveryEvent=None
+
+        while self.inFlight and self.inFlight[0][0]<=self.env.now:
+            arrival,item=self.inFlight.popleft()
+            self._putDownstream(item)
+
+        if self.inFlight:
+            self._scheduleDelivery()
+
+    def _deliverRemote(self,event):
+        """delivers the item of an event replayed by a ParallelRunner, launched by the copy of the pipeline
+            simulated by another partition"""
+
+        self._putDownstream(event.value)
+
+    def _putDownstream(self,item):
+
+        if self.pathRecorder:
+            self.pathRecorder.leave(self, item)
+        putEvent=self.toDn.put(item) # writing the packet into downstream
+        if isinstance(putEvent,NewEvent):
+            putEvent.callbacks.append(putEvent.recycle)
 
     def _updatePutDebt(self,item):
         ticks,debt=item.getTicks(self.putBytesPerCycle)
@@ -108,6 +199,7 @@ class Pipeline(Component):
         
         self.totalBitsSent += event.item.getBytes()*8
         self.lastActivity=self.env.now
+        self.wakeMonitor()
 
     def _do_put(self, event):
         """Perform the *put* operation.
@@ -122,11 +214,11 @@ class Pipeline(Component):
         """
         pkt=event.item
         ticks=self.addPostPutDelay(pkt)
-        event.callbacks.append(self.postPutMsg)
+        event.callbacks.append(self._finishPut)
         event.callbacks.append(self._updateTotalBitsSent)
-        self.prePutMsg(event)
+        self._startPut(event)
         event.succeed(delay=ticks)
-        self.env.process(self._putdelay(pkt))
+        self._launch(pkt)
 
         if self.firstActivity==None:
             self.firstActivity=self.env.now
@@ -164,15 +256,27 @@ class Pipeline(Component):
         lastTotalBitsSent=0
                
         bw_interval=0
+        nextSample=self.monitorInterval
 
         while True:
 
-            yield self.env.timeout(self.monitorInterval)
+            yield self.env.timeout(nextSample)
+            idle=self.totalBitsSent==lastTotalBitsSent
             bw_interval = (self.totalBitsSent - lastTotalBitsSent) / (self.monitorInterval)
             self.bw.append(bw_interval)
             lastTotalBitsSent=self.totalBitsSent
             self.timeSamples.append(self.env.now)
 
+            nextSample=self.monitorInterval
+            if idle:
+                # nothing sent for a whole interval: sleep until the next packet is sent
+                nextSample=yield from self.idleWait()
+
+    def addIdleSample(self, time):
+
+        self.bw.append(0.0)
+        self.timeSamples.append(time)
+
     def dumpBwVsTime(self):
 
         """this function returns a list of useful statistics about the write side of the buffer throughout the simulation:
@@ -191,6 +295,7 @@ class Pipeline(Component):
             The values are adjusted for the simTicksPerCycle so the time is in hardware cycles and the bandwidth is in Gbps"""
 
 
+        self.catchUpMonitor(self.env.now, inclusive=False)
         name=''
         time= [name]+[t/simTicksPerCycle for t in self.timeSamples]
         sendBw= [name]+[bw*simTicksPerCycle for bw in self.bw]
@@ -201,6 +306,7 @@ class Pipeline(Component):
         
         """returns a list of statistics on the operation: 
                 1- """
+        self.catchUpMonitor(self.env.now, inclusive=False)
         name=''
         maxbw=simTicksPerCycle*max(self.bw) if self.bw!=[] else 0
         firstActivity=self.firstActivity if self.firstActivity else 0
@@ -230,8 +336,14 @@ class FlowControlledPipeline(Pipeline):
     the item will hog the pipeline for. THIS IS DIFFERENT THAN THE TIME TAKEN TO REACH THE
     END OF THE PIPELINE (that is given by the depth parameter)
 
+    When the pipeline is simulated elsewhere than its downstream component (eg by another partition of a
+    ParallelRunner), :meth:`setRemoteCredits()` makes the copy of the pipeline simulated with the downstream
+    hand the credits it dispatches to a function instead of returning them to the credit counter.
+
     """
 
+    remoteCredits=None
+
     def __init__(self, env, name, parent=None, depth=1,putBytesPerCycle=16,initCredits=4,monitorBW=False,monitorInterval=250):
 
         Pipeline.__init__(self,env, name, parent,depth,putBytesPerCycle,monitorBW,monitorInterval)
@@ -249,14 +361,33 @@ class FlowControlledPipeline(Pipeline):
             self.Log( 'FATAL_ERROR', "received credit while credit counter is saturated")
 
         self.CreditBuffer.put(1)
+        if self.tracer:
+            self.tracer.record(self, CREDIT_RECEIVED)
         self.Log('INFO', "credit received from downstream")
 
     def putCredit(self,*args):
 
-        putCreditEvent=NewEvent(self.env)
-        putCreditEvent.callbacks+=[self._increment_credit,self._trigger_put]
+        if self.toDn.tracer:
+            self.toDn.tracer.record(self.toDn, CREDIT_DISPATCHED)
         self.toDn.Log('INFO', "credit dispatched")
-        putCreditEvent.succeed(delay=self.depth*simTicksPerCycle)
+        self._returnCredit(self.env.now)
+
+    def setRemoteCredits(self, send):
+        """Makes the pipeline call send(dispatchTime) for every credit dispatched by its downstream instead of
+            returning it to the credit counter, None to return the credits again"""
+
+        self.remoteCredits=send
+
+    def _returnCredit(self,dispatchTime):
+        """the credit dispatched by the downstream at dispatchTime reaches the counter depth cycles later"""
+
+        if self.remoteCredits:
+            self.remoteCredits(dispatchTime)
+            return
+
+        putCreditEvent=self.eventPool.acquire(self.env)
+        putCreditEvent.callbacks+=[self._increment_credit,self._trigger_put,putCreditEvent.recycle]
+        putCreditEvent.succeed(delay=dispatchTime+self.depth*simTicksPerCycle-self.env.now)
 
     def _do_put(self, event):
         """Perform the *put* operation.
@@ -272,16 +403,18 @@ class FlowControlledPipeline(Pipeline):
         if self.CreditBuffer.items:
 
             self.CreditBuffer.get()
-            self.Log( 'DEBUG', "credit consumed. {} remaining credits".format(len(self.CreditBuffer.items)))
+            if self.tracer:
+                self.tracer.record(self, CREDIT_CONSUMED, value=len(self.CreditBuffer.items))
+            self.Log( 'DEBUG', "credit consumed. {} remaining credits", len(self.CreditBuffer.items), pkt=event.item)
             
             pkt=event.item
             ticks=self.addPostPutDelay(pkt)
-            event.callbacks.append(self.postPutMsg)
+            event.callbacks.append(self._finishPut)
             event.callbacks.append(self._updateTotalBitsSent)
 
-            self.prePutMsg(event)
+            self._startPut(event)
             event.succeed(delay=ticks)
-            self.env.process(self._putdelay(event.item))
+            self._launch(pkt)
 
             if not self.firstActivity:
                 self.firstActivity=self.env.now
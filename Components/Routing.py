@@ -0,0 +1,177 @@
+import json
+import hashlib
+import os
+from collections import deque
+
+#---------------------------------------------------------------------------------
+# Routing: destination to outPort tables compiled from a topology
+#---------------------------------------------------------------------------------
+_nextHopCache={} #the next hops of the topologies already solved in this process, keyed by their links
+
+class Topology(object):
+    """ A directed graph of nodes 0..nodes-1 (routers, processors...) connected by links, from which the routing
+        tables of the crossbars are compiled with shortest paths.
+
+        The shortest paths are only computed once per set of links: the next hops are kept for the whole process
+        (so the platforms of a sweep or of repeated runs built on the same topology share them) and, if a cacheDir
+        is given, in a file of that directory for the runs of later processes.
+
+        Among the links leaving a node towards a destination, those on a shortest path are the candidates of the
+        destination, in the order the links were given. The first one is the deterministic route, so giving the X
+        links of a mesh before its Y links gives dimension ordered (XY) routing.
+
+        Arguments:
+            * nodes   : the number of nodes
+            * links   : a list of directed links (fromNode, toNode)
+            * cacheDir: a directory where the next hops are cached between processes (None to only cache them in
+                        the process)
+
+        Class members:
+            * neighbours: a list indexed by node of the nodes its links lead to, in the order they were given
+
+        Methods:
+            * ring(nodes, direction), mesh(rows, cols), torus(rows, cols): build the usual topologies, the node of
+                                                                          row r and column c of a mesh/torus being
+                                                                          r*cols+c
+            * nextHops(): the list indexed by [node][destination] of the candidate next nodes (() if unreachable)
+            * table(node, ports, adaptive): compiles the RoutingTable of a crossbar of node, ports being a dictionary
+                                            {next node: outPort} in which node itself is the outPort of the packets
+                                            addressed to node
+
+        usage:
+            ringA=Topology.ring(6)
+            router.arbiters['rea'].setRoutingTable(ringA.table(3, {4:0, 3:1}), 'destProc')
+    """
+
+    def __init__(self, nodes, links, cacheDir=None):
+
+        self.nodes=nodes
+        self.links=list(links)
+        self.cacheDir=cacheDir
+        self.neighbours=[[] for node in range(nodes)]
+
+        for fromNode, toNode in self.links:
+            if not (0<=fromNode<nodes and 0<=toNode<nodes):
+                raise RuntimeError("ERROR: link ({}, {}) of a topology of {} nodes".format(fromNode, toNode, nodes))
+            self.neighbours[fromNode].append(toNode)
+
+    @classmethod
+    def ring(cls, nodes, direction=1, cacheDir=None):
+        """a unidirectional ring where node i links to node i+direction, or a bidirectional one if direction is 0"""
+
+        steps=[direction] if direction else [1, -1]
+        return cls(nodes, [(node, (node+step)%nodes) for node in range(nodes) for step in steps], cacheDir)
+
+    @classmethod
+    def mesh(cls, rows, cols, cacheDir=None):
+
+        links=[]
+        for row in range(rows):
+            for col in range(cols):
+                node=row*cols+col
+                links+=[(node, node+1)] if col<cols-1 else []
+                links+=[(node, node-1)] if col>0 else []
+                links+=[(node, node+cols)] if row<rows-1 else []
+                links+=[(node, node-cols)] if row>0 else []
+        return cls(rows*cols, links, cacheDir)
+
+    @classmethod
+    def torus(cls, rows, cols, cacheDir=None):
+
+        links=[]
+        for row in range(rows):
+            for col in range(cols):
+                node=row*cols+col
+                neighbours=[]
+                for neighbour in (row*cols+(col+1)%cols, row*cols+(col-1)%cols, ((row+1)%rows)*cols+col, ((row-1)%rows)*cols+col):
+                    # rings of 1 or 2 nodes would link a node to itself or twice to the same neighbour
+                    if neighbour!=node and neighbour not in neighbours:
+                        neighbours.append(neighbour)
+                links+=[(node, neighbour) for neighbour in neighbours]
+        return cls(rows*cols, links, cacheDir)
+
+    def _key(self):
+
+        return hashlib.sha1(repr((self.nodes, self.links)).encode()).hexdigest()
+
+    def nextHops(self):
+
+        key=self._key()
+        if key in _nextHopCache:
+            return _nextHopCache[key]
+
+        cacheFile=os.path.join(self.cacheDir, 'nexthops-{}.json'.format(key)) if self.cacheDir else None
+        if cacheFile and os.path.exists(cacheFile):
+            with open(cacheFile) as f:
+                nextHops=[[tuple(hops) for hops in row] for row in json.load(f)]
+        else:
+            nextHops=self._shortestPaths()
+            if cacheFile:
+                os.makedirs(self.cacheDir, exist_ok=True)
+                with open(cacheFile+'.tmp', 'w') as f:
+                    json.dump(nextHops, f)
+                os.replace(cacheFile+'.tmp', cacheFile)
+
+        _nextHopCache[key]=nextHops
+        return nextHops
+
+    def _shortestPaths(self):
+        """one breadth first search per destination over the reversed links gives the distance of every node to
+            the destination, the next hops of a node being its neighbours one step closer"""
+
+        upstream=[[] for node in range(self.nodes)]
+        for fromNode, toNode in self.links:
+            upstream[toNode].append(fromNode)
+
+        nextHops=[[()]*self.nodes for node in range(self.nodes)]
+
+        for destination in range(self.nodes):
+            distance=[None]*self.nodes
+            distance[destination]=0
+            queue=deque([destination])
+            while queue:
+                node=queue.popleft()
+                for fromNode in upstream[node]:
+                    if distance[fromNode] is None:
+                        distance[fromNode]=distance[node]+1
+                        queue.append(fromNode)
+
+            for node in range(self.nodes):
+                if distance[node]:
+                    nextHops[node][destination]=tuple(neighbour for neighbour in dict.fromkeys(self.neighbours[node])
+                                                      if distance[neighbour]==distance[node]-1)
+
+        return nextHops
+
+    def table(self, node, ports, adaptive=False):
+
+        nextHops=self.nextHops()[node]
+        outPorts=[None]*self.nodes
+        candidates=[()]*self.nodes
+
+        for destination in range(self.nodes):
+            hops=(node,) if destination==node else nextHops[destination]
+            missing=[hop for hop in hops if hop not in ports]
+            if missing:
+                raise RuntimeError("ERROR: no outPort given towards node {} for the routing table of node {}".format(missing[0], node))
+            candidates[destination]=tuple(ports[hop] for hop in hops)
+            outPorts[destination]=candidates[destination][0] if hops else None
+
+        return RoutingTable(outPorts, candidates if adaptive else None)
+
+class RoutingTable(object):
+    """ The routing table of a crossbar: the outPort of the packets addressed to each destination, looked up with a
+        single indexed read when a packet is routed (see Crossbar.setRoutingTable()).
+
+        Arguments:
+            * outPorts  : a list indexed by destination of the outPort of the packets addressed to it (None if
+                          the destination cannot be reached)
+            * candidates: for adaptive routing, a list indexed by destination of the tuple of outPorts the packets
+                          addressed to it may take, the crossbar choosing between them with adaptiveRoute()
+                          (None for deterministic routing)
+    """
+
+    def __init__(self, outPorts, candidates=None):
+
+        self.outPorts=outPorts
+        self.candidates=candidates
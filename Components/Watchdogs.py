@@ -0,0 +1,226 @@
+from Components.BasicComponent import Component
+from Components.Buffers import Buffer
+from Components.Pipelines import Pipeline, FlowControlledPipeline
+from Components.Arbiters import Crossbar
+from simpyExtensions.util import NewEvent
+from simpy.core import StopSimulation
+from SimSettings import simTicksPerCycle
+
+#---------------------------------------------------------------------------------
+# Watchdogs: stall and deadlock detection
+#---------------------------------------------------------------------------------
+class DeadlockWatchdog(Component):
+    """ A component that watches all the Buffers, Pipelines and Crossbars below a root unit (by default its parent)
+        and stops the simulation when the model is stalled.
+
+        The model is considered stalled when no packet has been written into or read from a buffer, or sent down
+        a pipeline, for stallCycles cycles while some packet is still waiting to move, i.e. there is a pending put,
+        a crossbar holding a routed packet or a pipeline waiting for credits. Pending gets alone (eg a processor
+        waiting for packets that will never come) are not a stall. While no packet is waiting the watchdog sleeps,
+        the watched components waking it up when a put is requested or a crossbar routes a packet, so that an idle
+        model costs no periodic checks.
+
+        When a stall is detected, a wait-for graph is built between the watched components:
+            - a writer waits for a buffer/pipeline on which it has a pending put
+            - a non-empty buffer waits for the crossbar inPort (or component) reading from it
+            - a crossbar inPort holding a routed packet waits for the downstream of the outPort it was routed to
+            - a flow controlled pipeline with no credits left waits for its downstream
+        Crossbar inPorts are separate nodes of the graph, named fullname[inPort].
+        A cycle in the graph is reported as a deadlock, then the simulation is stopped: env.run() returns the
+        list of nodes forming the cycle (None if the graph has no cycle).
+
+        Class members:
+            - root: the unit whose components are watched
+            - watched: the watched components, listed when the simulation starts
+            - stallCycles: number of cycles without any packet movement after which the model is declared stalled
+            - stopOnStall: if False, stalls are only reported and the simulation carries on
+            - stalled: True once a stall has been detected
+            - waitForGraph: a dictionary {node:[(node, reason)]} built when the stall was detected
+            - deadlockCycle: the list of nodes forming the cycle found in waitForGraph, None if there is none
+
+        usage: DeadlockWatchdog(env,'watchdog',platform,stallCycles=1000)
+    """
+
+    def __init__(self, env, name, parent=None, root=None, stallCycles=1000, stopOnStall=True):
+
+        Component.__init__(self, env, name, parent)
+        self.root=root if root is not None else parent
+        self.stallCycles=stallCycles
+        self.stopOnStall=stopOnStall
+        self.stalled=False
+        self.waitForGraph={}
+        self.deadlockCycle=None
+        self.watched=[]
+
+    def run(self):
+
+        # the platform is complete once the simulation starts
+        self.watch()
+        lastProgress=None
+
+        while True:
+
+            yield self.env.timeout(self.stallCycles*simTicksPerCycle)
+
+            if not self.pendingWaits():
+                self.stalled=False
+                yield self.monitorSleep()
+                lastProgress=None
+                continue
+
+            progress=self.progress()
+
+            if progress!=lastProgress:
+                self.stalled=False
+
+            elif not self.stalled:
+                self.stalled=True
+                self.waitForGraph=self.buildWaitForGraph()
+                self.deadlockCycle=self.findCycle(self.waitForGraph)
+                self.report()
+
+                if self.stopOnStall:
+                    stopEvent=NewEvent(self.env)
+                    stopEvent.callbacks.append(StopSimulation.callback)
+                    stopEvent.succeed(self.deadlockCycle)
+
+            lastProgress=progress
+
+    def watchedComponents(self):
+
+        return [c for c in self.root.walk() if isinstance(c, (Buffer, Pipeline, Crossbar))]
+
+    def watch(self):
+        """lists the watched components once and makes them wake the watchdog up"""
+
+        self.watched=self.watchedComponents()
+        self.buffers=[c for c in self.watched if isinstance(c, Buffer)]
+        self.pipelines=[c for c in self.watched if isinstance(c, Pipeline)]
+        self.creditPipelines=[c for c in self.pipelines if isinstance(c, FlowControlledPipeline)]
+        self.crossbars=[c for c in self.watched if isinstance(c, Crossbar)]
+        for component in self.watched:
+            component.deadlockWatchdog=self
+
+    def progress(self):
+        """returns a counter that increases every time a packet moves through one of the watched components"""
+
+        return sum(c.totalWrBits+c.totalRdBits for c in self.buffers)+\
+               sum(c.totalBitsSent+len(c.inFlight) for c in self.pipelines)
+
+    def pendingWaits(self):
+        """returns True if a packet is waiting to move somewhere in the watched components"""
+
+        return any(c.put_queue for c in self.buffers) or any(c.put_queue for c in self.pipelines) or \
+               any(c.CreditBuffer.peek_queue for c in self.creditPipelines) or \
+               any(route is not None for c in self.crossbars for route in c.routes)
+
+    @staticmethod
+    def _connections(connection):
+        """returns the (port, component) pairs of a toUp/toDn member, which is either a dictionary or a single component"""
+
+        if isinstance(connection, dict):
+            return list(connection.items())
+        if connection is None:
+            return []
+        return [(0, connection)]
+
+    @staticmethod
+    def _node(component, port=None):
+
+        if isinstance(component, Crossbar):
+            return '{}[{}]'.format(component.fullname, port)
+        return component.fullname
+
+    def buildWaitForGraph(self):
+        """returns the wait-for graph between the watched components as a dictionary {node:[(node, reason)]}"""
+
+        components=self.watched
+        writers={}
+        readers={}
+
+        for component in components:
+            for port, up in self._connections(component.toUp):
+                readers.setdefault(id(up), []).append(self._node(component, port))
+            for port, dn in self._connections(component.toDn):
+                # a crossbar writes downstream on behalf of the inPort that last won the arbitration
+                writer=self._node(component, component.lastport[port]) if isinstance(component, Crossbar) else self._node(component)
+                writers.setdefault(id(dn), []).append(writer)
+
+        graph={}
+
+        def addEdge(fromNode, toNode, reason):
+            graph.setdefault(fromNode, []).append((toNode, reason))
+
+        for component in components:
+            node=self._node(component)
+
+            if isinstance(component, Crossbar):
+                for inPort, outPort in enumerate(component.routes):
+                    if outPort is None:
+                        continue
+                    target=dict(self._connections(component.toDn))[outPort]
+                    addEdge(self._node(component, inPort), self._node(target, 0),
+                        'holds packet {} routed towards'.format(component.routedPktList[inPort].uid))
+                continue
+
+            if component.put_queue:
+                for writer in writers.get(id(component), []):
+                    addEdge(writer, node, 'has a pending put into')
+
+            if isinstance(component, Buffer) and component.items:
+                for reader in readers.get(id(component), []):
+                    addEdge(node, reader, 'holds {} packets waiting to be drained by'.format(len(component.items)))
+
+            if isinstance(component, Buffer):
+                for event in component.get_queue:
+                    if event.caller is not None and event.caller in components:
+                        addEdge(self._node(event.caller, event.item), node, 'has a pending get from')
+
+            if isinstance(component, FlowControlledPipeline) and \
+               (not component.CreditBuffer.items or component.CreditBuffer.peek_queue):
+                for port, dn in self._connections(component.toDn):
+                    addEdge(node, self._node(dn, port), 'waits for credits from')
+
+        return graph
+
+    @staticmethod
+    def findCycle(graph):
+        """returns the list of nodes of the first cycle found in the graph (depth first search), None if there is none"""
+
+        visited=set()
+
+        for start in graph:
+            if start in visited:
+                continue
+
+            path=[start]
+            onPath={start:0}
+            stack=[iter(graph.get(start, []))]
+            visited.add(start)
+
+            while stack:
+                for toNode, reason in stack[-1]:
+                    if toNode in onPath:
+                        return path[onPath[toNode]:]
+                    if toNode not in visited:
+                        visited.add(toNode)
+                        onPath[toNode]=len(path)
+                        path.append(toNode)
+                        stack.append(iter(graph.get(toNode, [])))
+                        break
+                else:
+                    stack.pop()
+                    del onPath[path.pop()]
+
+        return None
+
+    def report(self):
+
+        infolist=['{} {} {}'.format(fromNode, reason, toNode) for fromNode in self.waitForGraph for toNode, reason in self.waitForGraph[fromNode]]
+
+        if self.deadlockCycle:
+            self.Log('WARNING', "Deadlock detected: no packet has moved for {} cycles. Wait-for cycle: {}"\
+                .format(self.stallCycles, ' -> '.join(self.deadlockCycle+[self.deadlockCycle[0]])), infolist=infolist)
+        else:
+            self.Log('WARNING', "Stall detected: no packet has moved for {} cycles while packets are waiting. No wait-for cycle found"\
+                .format(self.stallCycles), infolist=infolist)
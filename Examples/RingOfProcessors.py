@@ -15,7 +15,8 @@
      but because this is a ring, and because the traffic pattern is arbitrary, deadlocks are possible if the number of packets
      are increased such that the ring is full of packets and a cyclic dependency is created. The simulation will be stuck and
      analyzing the log will show where each packet is stuck. the number of packets can be increased in the runEgport() method
-     of the Processor class
+     of the Processor class. The platform includes a DeadlockWatchdog which logs the cyclic dependency as a warning and stops
+     the simulation once no packet has moved for 1000 cycles.
     """
 
 from Platforms import Platform
@@ -23,36 +24,17 @@ from Components.BasicComponent import Unit
 from Components.Buffers import FlowControlledBuffer
 from Components.Pipelines import FlowControlledPipeline
 from Components.Arbiters import RoundRobinCrossbar
+from Components.Routing import Topology
 from Components.Packets import BasePacket
-import random
+from Components.Watchdogs import DeadlockWatchdog
 import logging
 from simpy import Environment
 
 class RouterEgressArbiter(RoundRobinCrossbar):
-    
-    def route(self, peekEvent):
-
-        """ the peek event is the one that contains the inPort where a packet arrived 
-            and the packet that arrived on it"""
-
-        inPort=self.peekEvents.index(peekEvent) #the inPort at which the packet was detected
-        pkt=peekEvent.value  # the original packet before 
-
-        if pkt.f['destProc']==self.parent.routerID and inPort==0:
-
-            outPort=1
-
-        else:
-
-            outPort=0
-
-        #-----maintaining list of routed packets and their destinations---#
-        self.routes[inPort]=outPort
-        self.routedPktList[inPort]=pkt
-        inPortName=self.toUp[inPort].name if self.inPorts>1 else self.toUp.name
-        outPortName=self.toDn[outPort].name if self.outPorts>1 else self.toDn.name
-        self.Log('DEBUG','Packet {} from {} was routed to {}'.format(pkt.uid, inPortName, outPortName))
 
+    """ the packets are routed with the table set by the Router: inPort 0 is the ring, inPort 1 the processor,
+        outPort 0 the next router on the ring and outPort 1 the processor"""
+    
     def unMask(self,pkt, outPort):
 
         #----Start of Request Unmasking Event---#
@@ -60,7 +42,7 @@ class RouterEgressArbiter(RoundRobinCrossbar):
         return self.toDn[outPort].waitForCredit(pkt)
 
 class Router(Unit):
-    def __init__(self, env, name, parent=None,routerID=None):
+    def __init__(self, env, name, parent=None,routerID=None,ringSize=6):
         super().__init__(env, name, parent)
 
         self.routerID=routerID
@@ -81,6 +63,13 @@ class Router(Unit):
         self.arbiters['rea']=RouterEgressArbiter(env,'reaArb',self,inPorts=2,outPorts=2,pushMode=True)
         self.arbiters['reb']=RouterEgressArbiter(env,'rebArb',self,inPorts=2,outPorts=2,pushMode=True)
 
+        # ring A runs from router i to router i+1, ring B from router i to router i-1. The packets addressed to
+        # the processor of the router leave the ring on outPort 1
+        ringA=Topology.ring(ringSize, direction=1)
+        ringB=Topology.ring(ringSize, direction=-1)
+        self.arbiters['rea'].setRoutingTable(ringA.table(routerID, {(routerID+1)%ringSize:0, routerID:1}), 'destProc')
+        self.arbiters['reb'].setRoutingTable(ringB.table(routerID, {(routerID-1)%ringSize:0, routerID:1}), 'destProc')
+
         self.connectInternal()
 
     def connectInternal(self):
@@ -134,16 +123,16 @@ class Processor(Unit):
 
         while True:
             pkt= yield igport.get()
-            yield self.env.timeout(random.randint(5,30))
-            self.Log('INFO','Received Packet {} from Processor {}'.format(pkt.uid,pkt.f['srcProc']))
+            yield self.env.timeout(self.rng.randint(5,30))
+            self.Log('INFO','Received Packet {} from Processor {}', pkt.uid, pkt.f['srcProc'], pkt=pkt)
 
     def runEgPort(self,egport):
 
         for i in range(1):
 
-            destProc=random.randint(0,5)
+            destProc=self.rng.randint(0,5)
             while destProc==self.processorID:
-                destProc=random.randint(0,5)
+                destProc=self.rng.randint(0,5)
     
             pkt= BasePacket(fields={'srcProc':self.processorID,'destProc':destProc})
             yield egport.put(pkt)
@@ -160,6 +149,7 @@ class Example1(Platform):
         super().__init__(env,name,parent)
         self.createSystem()
         self.unitConns()
+        self.watchdog=DeadlockWatchdog(env,'watchdog',self,stallCycles=1000)
 
     def connectP2R(self,processor,router):
         #Connect processor to router
@@ -0,0 +1,387 @@
+import multiprocessing
+import traceback
+from heapq import heappush, heappop
+from itertools import count
+from simpy import Environment
+from simpy.core import Infinity, EmptySchedule, StopSimulation
+from simpy.events import NORMAL, EventPriority
+from Components.BasicComponent import ComponentBase, Unit
+from Components.Buffers import Buffer
+from Components.Pipelines import Pipeline, FlowControlledPipeline
+from SimSettings import simTicksPerCycle
+
+#---------------------------------------------------------------------------------
+# Environment ordering the events of a tick by partition
+#---------------------------------------------------------------------------------
+class PartitionedEnvironment(Environment):
+    """ An Environment breaking the ties between events due at the same time with the same priority by the time they
+        were scheduled at, then by the partition that scheduled them, then by the order in which that partition
+        scheduled them, instead of by the order in which they were scheduled. The events scheduled by a partition are
+        still processed in the order it scheduled them, but the order of its events does not depend on when the other
+        partitions scheduled theirs: a partition processes its events in the same order whether it is simulated alone
+        or with the others, which is what makes ParallelRunner.run() return the statistics of runSequential().
+
+        An event is scheduled by the partition of the event being processed, by the partition set by ParallelRunner
+        while the platform is built, and by partition -1 otherwise (eg the until event of run()).
+
+        Class members:
+            * partition: the partition scheduling the events, that of the event being processed while processing it
+
+        usage: env=PartitionedEnvironment(); env.partition=1; env.timeout(10) -> processed with partition 1 running
+    """
+
+    def __init__(self, initial_time=0):
+
+        super().__init__(initial_time)
+        self.partition=-1
+        self.eids={}
+
+    def eid(self):
+        """returns the tie breaking key of an event the running partition schedules now"""
+
+        eids=self.eids.get(self.partition)
+        if eids is None:
+            eids=self.eids[self.partition]=count()
+        return (self._now, self.partition, next(eids))
+
+    def schedule(self, event, priority=NORMAL, delay=0):
+        """Schedule an *event* with a given *priority* and a *delay*."""
+
+        heappush(self._queue, (self._now+delay, priority, self.eid(), self.partition, event))
+
+    def replay(self, event, value, eid, partition, at):
+        """triggers an event with the given value, processed at the given time by the given partition and ordered
+            by the given key, as returned by eid() where the event was sent from"""
+
+        event._ok=True
+        event._value=value
+        heappush(self._queue, (at, NORMAL, eid, partition, event))
+
+    def step(self):
+        """Process the next event.
+
+        Raise an :exc:`EmptySchedule` if no further events are available.
+
+        """
+        try:
+            self._now, _, _, self.partition, event = heappop(self._queue)
+        except IndexError:
+            raise EmptySchedule from None
+
+        # Process callbacks of the event. Set the events callbacks to None
+        # immediately to prevent concurrent modifications.
+        callbacks, event.callbacks = event.callbacks, None
+        try:
+            for callback in callbacks:
+                callback(event)
+        except StopSimulation:
+            # Reassociate any remaining callbacks with the event and reschedule
+            # the event to be processed when the simulation resumes.
+            event.callbacks = callbacks[callbacks.index(callback) + 1 :]
+            self.schedule(event, EventPriority(-1))
+            raise
+        finally:
+            self.partition=-1
+
+        if not event._ok and not hasattr(event, '_defused'):
+            # The event has failed and has not been defused. Crash the
+            # environment.
+            # Create a copy of the failure exception with a new traceback.
+            exc = type(event._value)(*event._value.args)
+            exc.__cause__ = event._value
+            raise exc
+
+#---------------------------------------------------------------------------------
+# Conservative parallel simulation of a platform across processes
+#---------------------------------------------------------------------------------
+class ParallelRunner(object):
+    """ Runs a Platform split into partitions, each simulated by its own worker process with its own Environment,
+        and returns the statistics of all its Buffers, Pipelines and Crossbars.
+
+        Every worker builds the whole platform by calling platformFactory(env), then only runs the components of the
+        top-level units (platform.unitDict) assigned to its partition: the run() of every other component is never
+        started (see ComponentBase.runFilter). Components that are not part of a top-level unit cannot run in any
+        partition: a RuntimeError is raised if one of them has a run() of its own (eg a platform-level watchdog).
+
+        Partitions may only be connected through Pipelines feeding a Buffer of another partition, the depth of these
+        links is the lookahead of the simulation:
+            - a packet launched into the link at time t is sent to the partition of the buffer (see
+              Pipeline.setRemoteLaunch()), where an event delivers it into the buffer at t+depth
+            - a credit dispatched by a FlowControlledBuffer at time t is sent back to the partition of the pipeline
+              (see FlowControlledPipeline.setRemoteCredits()) where an event returns it to the credit counter at t+depth
+        The workers advance in lock step windows of at most lookahead ticks starting at the earliest pending event of
+        the whole platform: nothing sent during a window can take effect before the window ends, so the messages are
+        exchanged (through the parent process) and scheduled between windows and every partition processes its events
+        in time order. Idle periods of the whole platform are skipped.
+
+        run() and runSequential() both simulate the platform in PartitionedEnvironments and hand the packets and
+        credits over the links the same way, the event sent being ordered with the events of the partition receiving
+        it by the key it was given where it was sent (see PartitionedEnvironment.replay()). Every partition thus
+        processes the same events in the same (time, priority, key) order and run() returns the statistics of
+        runSequential(), unless the model depends on the global random module instead of the random streams of its
+        components (each worker has its own random state) or on packet uids (each worker numbers its packets).
+
+        Arguments:
+            * platformFactory : a function taking an Environment and returning the Platform to simulate. It must be
+                                picklable if the multiprocessing start method is not fork
+            * partitions      : either a number of partitions, the top-level units being split into contiguous chunks
+                                in creation order, or a list of lists of top-level unit names
+
+        Class members:
+            * lookahead: the smallest depth (in ticks) of the pipelines linking two partitions, computed by run()
+
+        usage:
+            def makePlatform(env):
+                return Example1(env,'RingOf6')
+            stats=ParallelRunner(makePlatform, partitions=2).run(until=10000)
+            stats['RingOf6.Router0.rea'] -> (dumpStats(), dumpBwVsTime())
+    """
+
+    def __init__(self, platformFactory, partitions=2):
+
+        self.platformFactory=platformFactory
+        self.partitions=partitions
+        self.lookahead=None
+
+    def partitionUnits(self, platform):
+        """returns the list of partitions, each a list of the top-level units simulated by a worker"""
+
+        units=list(platform.unitDict.values())
+
+        if isinstance(self.partitions, int):
+            count=min(self.partitions, len(units))
+            return [units[len(units)*rank//count:len(units)*(rank+1)//count] for rank in range(count)]
+
+        return [[platform.unitDict[name] for name in names] for names in self.partitions]
+
+    def owners(self, platform):
+        """returns a dictionary {fullname: partition index} of all the components of the partitioned units. Raises a
+            RuntimeError if a component outside of them has a run() of its own"""
+
+        owners={}
+        for rank, units in enumerate(self.partitionUnits(platform)):
+            for unit in units:
+                for component in unit.walk():
+                    owners[component.fullname]=rank
+
+        for component in platform.walk():
+            if component.fullname not in owners and type(component).run is not ComponentBase.run:
+                raise RuntimeError("ERROR: {} is not part of a top-level unit, no partition can simulate its run()"\
+                    .format(component.fullname))
+
+        return owners
+
+    def build(self, env, owners, rank=None):
+        """builds the platform in env, only starting the run() of the components of partition rank (all if None),
+            each component scheduling its first events as part of its partition"""
+
+        def runFilter(component):
+            env.partition=owners.get(component.fullname, -1)
+            return rank is None or env.partition==rank
+
+        ComponentBase.runFilter=runFilter
+        try:
+            return self.platformFactory(env)
+        finally:
+            ComponentBase.runFilter=None
+            env.partition=-1
+
+    @staticmethod
+    def _connections(connection):
+
+        if isinstance(connection, dict):
+            return [c for c in connection.values() if c is not None]
+        if connection is None:
+            return []
+        return [connection]
+
+    def links(self, platform, owners):
+        """returns the list of (pipeline, buffer) pairs connecting two partitions. Raises a RuntimeError if the
+            partitions are connected in any other way"""
+
+        links=[]
+
+        for component in platform.walk():
+            if isinstance(component, Unit) or component.fullname not in owners:
+                continue
+            rank=owners[component.fullname]
+
+            for dn in self._connections(component.toDn):
+                if owners.get(dn.fullname)==rank:
+                    continue
+                if not isinstance(component, Pipeline) or not isinstance(dn, Buffer) or dn.fullname not in owners:
+                    raise RuntimeError("ERROR: {} and {} are in different partitions, partitions can only be connected through a pipeline feeding a buffer"\
+                        .format(component.fullname, dn.fullname))
+                links.append((component, dn))
+
+            for up in self._connections(component.toUp):
+                if owners.get(up.fullname)==rank:
+                    continue
+                if not isinstance(up, Pipeline) or up.fullname not in owners or component not in self._connections(up.toDn):
+                    raise RuntimeError("ERROR: {} and {} are in different partitions, partitions can only be connected through a pipeline feeding a buffer"\
+                        .format(up.fullname, component.fullname))
+
+        return links
+
+    @staticmethod
+    def collectStats(components):
+
+        return {c.fullname:(c.dumpStats(), c.dumpBwVsTime()) for c in components if hasattr(c, 'dumpStats')}
+
+    def runSequential(self, until):
+        """runs the whole platform in a single Environment and returns the same statistics as run()"""
+
+        owners=self.owners(self.platformFactory(PartitionedEnvironment()))
+        env=PartitionedEnvironment()
+        platform=self.build(env, owners)
+        pipelines={c.fullname:c for c in platform.walk() if isinstance(c, Pipeline)}
+
+        # the links hand their packets and credits over as between partitions, only without leaving the environment
+        def deliver(dst, msg):
+            self._replay(env, pipelines, dst, *msg)
+
+        self._connectLinks(env, platform, owners, None, deliver)
+        env.run(until=until)
+
+        return self.collectStats([c for c in platform.walk() if c.fullname in owners])
+
+    def run(self, until):
+        """runs the partitions in parallel until the given time and returns a dictionary
+            {fullname: (dumpStats(), dumpBwVsTime())} of all the simulated components"""
+
+        # the lookahead is found from a platform built in this process, it is never run
+        platform=self.platformFactory(PartitionedEnvironment())
+        owners=self.owners(platform)
+        links=self.links(platform, owners)
+        self.lookahead=min([pipeline.depth*simTicksPerCycle for pipeline, buffer in links], default=Infinity)
+        if self.lookahead<1:
+            raise RuntimeError("ERROR: partitions must be connected through pipelines of non zero depth")
+        partitionCount=max(owners.values())+1 if owners else 0
+        del platform
+
+        conns=[]
+        workers=[]
+        for rank in range(partitionCount):
+            parentConn, workerConn=multiprocessing.Pipe()
+            worker=multiprocessing.Process(target=self._worker, args=(rank, workerConn, until, owners), daemon=True)
+            worker.start()
+            conns.append(parentConn)
+            workers.append(worker)
+
+        try:
+            stats=self._coordinate(conns, until)
+        finally:
+            for worker in workers:
+                worker.join(1)
+                if worker.is_alive():
+                    worker.terminate()
+
+        return stats
+
+    def _receive(self, conn):
+
+        msg=conn.recv()
+        if msg[0]=='error':
+            raise RuntimeError("ERROR: a partition failed:\n{}".format(msg[1]))
+        return msg[1:]
+
+    def _coordinate(self, conns, until):
+
+        reports=[self._receive(conn) for conn in conns]
+
+        while True:
+            # route the messages sent during the last window, in a deterministic order
+            inboxes=[[] for conn in conns]
+            nextTime=min([peek for outbox, peek in reports], default=Infinity)
+            for outbox, peek in reports:
+                for dst, msg in outbox:
+                    inboxes[dst].append(msg)
+                    nextTime=min(nextTime, msg[0])
+
+            end=min(nextTime+self.lookahead, until)
+            for conn, inbox in zip(conns, inboxes):
+                conn.send((end, sorted(inbox, key=lambda msg: msg[1])))
+
+            if end>=until:
+                break
+            reports=[self._receive(conn) for conn in conns]
+
+        stats={}
+        for conn in conns:
+            stats.update(self._receive(conn)[0])
+        return stats
+
+    def _worker(self, rank, conn, until, owners):
+
+        try:
+            env=PartitionedEnvironment()
+            # the owners were found by the parent process from a platform built the same way
+            platform=self.build(env, owners, rank)
+            pipelines={c.fullname:c for c in platform.walk() if isinstance(c, Pipeline)}
+            outbox=[]
+
+            self._connectLinks(env, platform, owners, rank, lambda dst, msg: outbox.append((dst, msg)))
+            conn.send(('sync', outbox, env.peek()))
+
+            while True:
+                end, inbox=conn.recv()
+                outbox.clear()
+
+                for msg in inbox:
+                    self._replay(env, pipelines, rank, *msg)
+
+                if end>env.now:
+                    env.run(until=end)
+                    # run() leaves the until event scheduled at end with no callbacks left, drop it so that
+                    # peek() returns the time of the next real event
+                    env.step()
+                if end>=until:
+                    break
+                conn.send(('sync', outbox, env.peek()))
+
+            conn.send(('stats', self.collectStats([c for c in platform.walk() if owners.get(c.fullname)==rank])))
+
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+
+        finally:
+            conn.close()
+
+    def _connectLinks(self, env, platform, owners, rank, send):
+        """makes the links send the packets and credits crossing partitions as send(dst partition, message), on the
+            sending side of the links of partition rank (of all the links if None)"""
+
+        for pipeline, buffer in self.links(platform, owners):
+            if rank is None or owners[pipeline.fullname]==rank:
+                pipeline.setRemoteLaunch(self._sender(env, send, owners[buffer.fullname], 'packet', pipeline))
+            if isinstance(pipeline, FlowControlledPipeline) and (rank is None or owners[buffer.fullname]==rank):
+                pipeline.setRemoteCredits(self._sender(env, send, owners[pipeline.fullname], 'credit', pipeline))
+
+    @staticmethod
+    def _sender(env, send, dst, kind, pipeline):
+        """returns the function passed to pipeline.setRemoteLaunch() (packets) or pipeline.setRemoteCredits()
+            (credits) on the side of a link that sends to the partition dst. A message is (effect time, key of the
+            event, kind, pipeline fullname, packet)"""
+
+        delay=pipeline.depth*simTicksPerCycle
+
+        if kind=='packet':
+            def launch(item, launchTime=None):
+                send(dst, (env.now+delay, env.eid(), kind, pipeline.fullname, item))
+            return launch
+
+        def returnCredit(dispatchTime):
+            send(dst, (dispatchTime+delay, env.eid(), kind, pipeline.fullname, None))
+        return returnCredit
+
+    @staticmethod
+    def _replay(env, pipelines, rank, effectTime, eid, kind, name, item):
+        """schedules the event a message takes effect with in partition rank"""
+
+        pipeline=pipelines[name]
+        event=pipeline.eventPool.acquire(env)
+        if kind=='packet':
+            event.callbacks+=[pipeline._deliverRemote, event.recycle]
+        else:
+            event.callbacks+=[pipeline._increment_credit, pipeline._trigger_put, event.recycle]
+        env.replay(event, item, eid, rank, effectTime)
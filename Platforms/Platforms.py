@@ -2,11 +2,13 @@ from Components.BasicComponent import Unit
 
 class Platform(Unit):
 
-    def __init__(self,env,name,parent):
+    def __init__(self,env,name,parent,masterSeed=None):
 
         Unit.__init__(self,env,name,parent)
 
         self.units={}
+        if masterSeed is not None:
+            self.setMasterSeed(masterSeed)
 
     def insertUnit(self,unitinstance):
 
@@ -0,0 +1,126 @@
+import multiprocessing
+import random
+from Platforms.Parallel import ParallelRunner
+from Platforms.Sweep import ParameterSweep
+
+#---------------------------------------------------------------------------------
+# Snapshots: continuations forked from a warmed-up simulation
+#---------------------------------------------------------------------------------
+_sweep=None # the SnapshotSweep being run, inherited by its worker processes as it holds unpicklable generators
+
+def _runForkedPoint(point):
+
+    return _sweep.runPoint(point)
+
+class Snapshot(object):
+    """ The state of a running simulation (the Environment, all the components and the pending events) at the time
+        the snapshot is taken, from which any number of continuations can be run.
+
+        The run() of the components are generators, which cannot be copied or pickled, so the snapshot is kept in
+        the memory of the process that took it and every continuation runs in a child process forked from it (the
+        fork start method of multiprocessing, POSIX only). A continuation never modifies the snapshot: the same
+        warmed-up state can be forked again and again.
+
+        A continuation is a function continuation(env, platform, **parameters) called in the child process before
+        the simulation is resumed. It may change the parameters of the components, start new traffic processes...
+
+        Arguments:
+            * env      : the Environment of the simulation, after it was run up to the end of the warm up
+            * platform : the Platform being simulated
+
+        Class members:
+            * time: the simulation time at which the snapshot was taken
+            * randomState: the state of the random module when the snapshot was taken. It is restored by every
+                           continuation as the random module reseeds itself in forked processes
+
+        usage:
+            env=Environment()
+            platform=Example1(env,'RingOf6')
+            env.run(until=warmUp)
+            snapshot=Snapshot(env, platform)
+            stats=snapshot.fork(startTraffic, until=warmUp+10000, rate=0.5)
+            rows=snapshot.sweep(startTraffic, {'rate':[0.1,0.5,0.9], 'seed':[1,2]}, until=warmUp+10000)
+    """
+
+    def __init__(self, env, platform):
+
+        self.env=env
+        self.platform=platform
+        self.time=env.now
+        self.randomState=random.getstate()
+
+    def resume(self, continuation, until, **parameters):
+        """runs a continuation in the current process and returns the statistics of the platform components. This
+            consumes the snapshot, it is what every forked process does. The random module and the random streams
+            of the components are reseeded with the 'seed' parameter if there is one, otherwise they carry on from
+            the state they had in the snapshot"""
+
+        random.setstate(self.randomState)
+        if 'seed' in parameters:
+            random.seed(parameters['seed'])
+            self.platform.setMasterSeed(parameters['seed'])
+        if continuation is not None:
+            continuation(self.env, self.platform, **parameters)
+        self.env.run(until=until)
+
+        return ParallelRunner.collectStats(self.platform.walk())
+
+    def fork(self, continuation, until, **parameters):
+        """runs a continuation in a forked process and returns the statistics of the platform components
+            {fullname: (dumpStats(), dumpBwVsTime())}"""
+
+        sweep=SnapshotSweep(self, continuation, {name:[value] for name, value in parameters.items()}, until, processes=1)
+        sweep.run()
+        return sweep.results[0][1]
+
+    def sweep(self, continuation, grid, until, processes=None):
+        """runs a continuation for every point of the grid, each in a forked process, and returns the results
+            table (see ParameterSweep.table())"""
+
+        return SnapshotSweep(self, continuation, grid, until, processes).run()
+
+class SnapshotSweep(ParameterSweep):
+    """ A ParameterSweep whose points are continuations of a Snapshot instead of complete simulations.
+
+        Every point runs in a new worker process forked from the process holding the snapshot. Unlike
+        ParameterSweep, the random streams are only reseeded when the grid has a 'seed' parameter: the continuations
+        otherwise carry on with the random state and packet uids of the snapshot.
+
+        Arguments:
+            * snapshot     : the Snapshot the points continue from
+            * continuation : the function continuation(env, platform, **point) run before resuming each point
+            * grid, until, processes: see ParameterSweep
+
+        usage: SnapshotSweep(snapshot, startTraffic, {'rate':[0.1,0.5,0.9]}, until=20000).run()
+    """
+
+    def __init__(self, snapshot, continuation, grid, until, processes=None):
+
+        ParameterSweep.__init__(self, None, grid, until, processes)
+        self.snapshot=snapshot
+        self.continuation=continuation
+
+    def runPoint(self, point):
+
+        return self.snapshot.resume(self.continuation, self.until, **point)
+
+    def run(self):
+
+        global _sweep
+
+        if self.until<=self.snapshot.time:
+            raise RuntimeError("ERROR: continuations must run beyond the snapshot time {}".format(self.snapshot.time))
+
+        points=self.points()
+        context=multiprocessing.get_context('fork')
+
+        # the pool workers are forked from this process while it holds the snapshot, one worker per point
+        # so that every point starts from the untouched snapshot
+        _sweep=self
+        try:
+            with context.Pool(self.processes, maxtasksperchild=1) as pool:
+                self.results=list(zip(points, pool.map(_runForkedPoint, points, chunksize=1)))
+        finally:
+            _sweep=None
+
+        return self.table()
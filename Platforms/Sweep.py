@@ -0,0 +1,194 @@
+import argparse
+import ast
+import csv
+import importlib
+import itertools
+import multiprocessing
+import random
+import sys
+from simpy import Environment
+from Components.Packets import BasePacket
+from Platforms.Parallel import ParallelRunner
+
+#---------------------------------------------------------------------------------
+# Parameter sweeps: one platform simulated for every point of a parameter grid
+#---------------------------------------------------------------------------------
+class ParameterSweep(object):
+    """ Simulates a platform for every point of a parameter grid, on a pool of worker processes, and merges the
+        dumpStats() of all its components into one results table, and their dumpBwVsTime() into a bandwidth table.
+
+        Every point is a dictionary {parameter: value} taken from the cartesian product of the grid. The platform is
+        built by platformFactory(env, **point) in a fresh Environment, so buffer capacities, pipeline depths,
+        arbiter weights... are whatever the factory makes of the parameters. Before building the platform, the
+        random module is seeded with the 'seed' parameter of the point (0 if the grid has none) and the packet uids
+        restart from 0, so the results of a point do not depend on the points the worker simulated before. The
+        'seed' parameter is also the master seed of the random streams of the platform components.
+
+        Arguments:
+            * platformFactory : a function taking an Environment and the parameters of a point as keyword arguments
+                                and returning the Platform to simulate. It must be picklable (eg defined at module level)
+            * grid            : a dictionary {parameter: list of values}
+            * until           : the time at which the simulation of every point ends
+            * processes       : the number of worker processes, os.cpu_count() by default
+            * envFactory      : the Environment class (or function) used for every point
+
+        Class members:
+            * results: a list of (point, {fullname: (dumpStats(), dumpBwVsTime())}) filled by run(), in grid order
+
+        usage:
+            def makePlatform(env, capacity, seed):
+                return Example1(env,'RingOf6',capacity=capacity)
+            sweep=ParameterSweep(makePlatform, {'capacity':[2,4,8], 'seed':[1,2,3]}, until=10000)
+            sweep.run()
+            sweep.writeCsv('sweep.csv', bwFilename='sweep_bw.csv')
+
+        or from the command line:
+            python -m Platforms.Sweep myModels:makePlatform --grid capacity=2,4,8 --grid seed=1,2,3 --until 10000 --csv sweep.csv \
+                --bw-csv sweep_bw.csv
+    """
+
+    statsColumns=['maxBw','averageBw0','averageBw1','averageBw2','averageBw3','totalBits','firstActivity','lastActivity','simTime']
+    bwColumns=['time','bw']
+
+    def __init__(self, platformFactory, grid, until, processes=None, envFactory=Environment):
+
+        self.platformFactory=platformFactory
+        self.grid=grid
+        self.until=until
+        self.processes=processes
+        self.envFactory=envFactory
+        self.results=[]
+
+    def points(self):
+
+        names=list(self.grid)
+        return [dict(zip(names, values)) for values in itertools.product(*[self.grid[name] for name in names])]
+
+    def runPoint(self, point):
+        """simulates a single point of the grid and returns the statistics of its components"""
+
+        random.seed(point.get('seed', 0))
+        BasePacket.nextuid=0
+
+        env=self.envFactory()
+        platform=self.platformFactory(env, **point)
+        if 'seed' in point:
+            platform.setMasterSeed(point['seed'])
+        env.run(until=self.until)
+
+        return ParallelRunner.collectStats(platform.walk())
+
+    def run(self):
+        """simulates all the points of the grid and returns the results table (see table())"""
+
+        points=self.points()
+
+        with multiprocessing.Pool(self.processes) as pool:
+            self.results=list(zip(points, pool.map(self.runPoint, points)))
+
+        return self.table()
+
+    def table(self):
+        """returns the results as a list of rows, one per component (one per inPort/outPort pair for a crossbar) and
+            grid point. Each row is a dictionary holding the parameters of the point, the component fullname, the port
+            ('' except for crossbars) and the values of dumpStats() named as in statsColumns"""
+
+        rows=[]
+
+        for point, stats in self.results:
+            for fullname, (componentStats, bwVsTime) in stats.items():
+                # crossbars return one list of statistics per inPort/outPort pair
+                for portStats in (componentStats if componentStats and isinstance(componentStats[0], list) else [componentStats]):
+                    row=dict(point)
+                    row['component']=fullname
+                    row['port']=portStats[0]
+                    row.update(zip(self.statsColumns, portStats[1:]))
+                    rows.append(row)
+
+        return rows
+
+    def bwTable(self):
+        """returns the bandwidth of the components over time as a list of rows, one per component (one per
+            inPort/outPort pair for a crossbar), grid point and monitoring interval. Each row is a dictionary holding
+            the parameters of the point, the component fullname, the port ('' except for crossbars), the end of the
+            interval (in cycles) and the bandwidth measured during the interval (in Gbps)"""
+
+        rows=[]
+
+        for point, stats in self.results:
+            for fullname, (componentStats, (time, bwVsTime)) in stats.items():
+                # crossbars return one series per inPort/outPort pair, the other components a single series
+                for series in (bwVsTime if bwVsTime and isinstance(bwVsTime[0], list) else [bwVsTime]):
+                    for t, bw in zip(time[1:], series[1:]):
+                        row=dict(point)
+                        row['component']=fullname
+                        row['port']=series[0]
+                        row.update(zip(self.bwColumns, (t, bw)))
+                        rows.append(row)
+
+        return rows
+
+    def writeCsv(self, filename, bwFilename=None):
+        """writes the results table into filename and, if bwFilename is given, the bandwidth table into it"""
+
+        with open(filename, 'w', newline='') as f:
+            self.writeRows(f)
+
+        if bwFilename:
+            with open(bwFilename, 'w', newline='') as f:
+                self.writeBwRows(f)
+
+    def writeRows(self, f):
+        """writes the results table as csv into the file object f"""
+
+        writer=csv.DictWriter(f, fieldnames=list(self.grid)+['component','port']+self.statsColumns)
+        writer.writeheader()
+        writer.writerows(self.table())
+
+    def writeBwRows(self, f):
+        """writes the bandwidth table as csv into the file object f"""
+
+        writer=csv.DictWriter(f, fieldnames=list(self.grid)+['component','port']+self.bwColumns)
+        writer.writeheader()
+        writer.writerows(self.bwTable())
+
+def _parseValue(value):
+
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+def main(argv=None):
+
+    parser=argparse.ArgumentParser(description="Simulates a platform for every point of a parameter grid")
+    parser.add_argument('factory', help="the platform factory as module:function, called as function(env, **point)")
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=V1,V2,...',
+                        help="the values taken by a parameter, may be repeated")
+    parser.add_argument('--until', type=int, required=True, help="the time at which the simulation of every point ends")
+    parser.add_argument('--processes', type=int, default=None, help="the number of worker processes (default: cpu count)")
+    parser.add_argument('--csv', default=None, help="the file the results table is written to (default: stdout)")
+    parser.add_argument('--bw-csv', default=None, help="the file the bandwidth over time of the components is written to")
+    args=parser.parse_args(argv)
+
+    moduleName, functionName=args.factory.split(':')
+    platformFactory=getattr(importlib.import_module(moduleName), functionName)
+
+    grid={}
+    for parameter in args.grid:
+        name, values=parameter.split('=', 1)
+        grid[name]=[_parseValue(value) for value in values.split(',')]
+
+    sweep=ParameterSweep(platformFactory, grid, args.until, processes=args.processes)
+    sweep.run()
+
+    if args.csv:
+        sweep.writeCsv(args.csv, args.bw_csv)
+    else:
+        sweep.writeRows(sys.stdout)
+        if args.bw_csv:
+            with open(args.bw_csv, 'w', newline='') as f:
+                sweep.writeBwRows(f)
+
+if __name__=='__main__':
+    main()
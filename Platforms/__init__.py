@@ -1,3 +1,6 @@
 from Platforms.Platforms import Platform
 
 
+from Platforms.Parallel import ParallelRunner, PartitionedEnvironment
+from Platforms.Sweep import ParameterSweep
+from Platforms.Snapshot import Snapshot, SnapshotSweep
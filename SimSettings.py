@@ -1 +1,2 @@
-simTicksPerCycle=2
\ No newline at end of file
+simTicksPerCycle=2
+masterSeed=0
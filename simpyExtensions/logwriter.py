@@ -0,0 +1,149 @@
+"""Writes the log messages of a simulation to a file from a background thread"""
+
+import atexit
+import logging
+import queue
+import threading
+
+#---------------------------------------------------------------------------------
+# Background log writer
+#---------------------------------------------------------------------------------
+class _EnqueueHandler(logging.Handler):
+    """hands the records over to the writer thread. The messages of ComponentBase.Log() are only rendered when
+        formatted (see LogMessage), so the records are queued as they are and the rendering is left to the writer
+        thread"""
+
+    def __init__(self, put, level):
+
+        logging.Handler.__init__(self, level)
+        self.put=put
+
+    def handle(self, record):
+
+        if self.filter(record):
+            self.put(record)
+        return True
+
+class BackgroundLogWriter(object):
+    """ Writes the log records of all the components (any logger propagating to the root logger) to a file from a
+        background thread, so the simulation does not block on file I/O. The records are put on a queue by the
+        simulation thread, the writer thread formats them and writes them in batches of up to batchSize records.
+
+        The writer is opt-in: it replaces logging.basicConfig(filename=...) for the duration of a run. Used as a
+        context manager around env.run(), every record logged by the run is in the file once the with block is
+        left, whether run() returned or raised. A writer still running when the interpreter exits is stopped then.
+
+        Arguments:
+            * filename  : the file the records are written to
+            * mode      : the mode the file is opened with, 'w' by default
+            * level     : the minimum level of the records written, all by default. The level of the root logger must
+                          still be set (eg with logging.getLogger().setLevel()) for the components to log anything
+            * fmt       : the format of the records, that of logging.basicConfig() by default
+            * batchSize : the maximum number of records written at once
+
+        Methods:
+            * start(): installs the writer on the root logger and starts its thread
+            * stop() : writes the pending records, closes the file and removes the writer from the root logger
+            * flush(): waits until all the records logged so far are written
+
+        usage:
+            logging.getLogger().setLevel(logging.INFO)
+            with BackgroundLogWriter("Examples/Ringof6.log"):
+                env.run(until=10000)
+    """
+
+    def __init__(self, filename, mode='w', level=logging.NOTSET, fmt=logging.BASIC_FORMAT, batchSize=1024):
+
+        self.filename=filename
+        self.mode=mode
+        self.level=level
+        self.formatter=logging.Formatter(fmt)
+        self.batchSize=batchSize
+        self.queue=queue.SimpleQueue()
+        self.handler=None
+        self.thread=None
+        self.error=None
+
+    def start(self):
+
+        if self.thread is not None:
+            raise RuntimeError("ERROR: the background log writer of {} is already running".format(self.filename))
+
+        self.file=open(self.filename, self.mode)
+        self.thread=threading.Thread(target=self._write, name='BackgroundLogWriter', daemon=True)
+        self.thread.start()
+        self.handler=_EnqueueHandler(self.queue.put, self.level)
+        logging.getLogger().addHandler(self.handler)
+        atexit.register(self.stop)
+        return self
+
+    def flush(self):
+
+        if self.thread is None:
+            return
+        done=threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def stop(self):
+
+        if self.thread is None:
+            return
+
+        logging.getLogger().removeHandler(self.handler)
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        self.thread=None
+        self.handler=None
+        atexit.unregister(self.stop)
+
+        if self.error is not None:
+            error, self.error=self.error, None
+            raise RuntimeError("ERROR: the background log writer of {} failed".format(self.filename)) from error
+
+    def __enter__(self):
+
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+
+        self.stop()
+
+    def _write(self):
+
+        get=self.queue.get
+        getNowait=self.queue.get_nowait
+        running=True
+
+        while running:
+            batch=[get()]
+            try:
+                while len(batch)<self.batchSize:
+                    batch.append(getNowait())
+            except queue.Empty:
+                pass
+
+            lines=[]
+            for record in batch:
+                if record is None:
+                    running=False
+                elif isinstance(record, threading.Event):
+                    self._writeLines(lines)
+                    lines=[]
+                    record.set()
+                else:
+                    lines.append(self.formatter.format(record))
+
+            self._writeLines(lines)
+
+    def _writeLines(self, lines):
+
+        if not lines or self.error is not None:
+            return
+        try:
+            self.file.write('\n'.join(lines)+'\n')
+            self.file.flush()
+        except Exception as error:
+            # reported by stop(), the queue keeps being drained so that the simulation never blocks
+            self.error=error
@@ -0,0 +1,183 @@
+"""Records the path of every packet through the Buffers, Pipelines and Crossbars, with the ticks spent at each hop"""
+
+from array import array
+
+#---------------------------------------------------------------------------------
+# Path recorder
+#---------------------------------------------------------------------------------
+class PathRecorder(object):
+    """ Records, for every packet, the hops it made through the components it is attached to as (component id,
+        enter tick, leave tick) triplets in an array keyed by packet uid.
+
+        A packet enters a Buffer when it is written into it and leaves it when it is read out, enters a Pipeline
+        when it starts being sent down the pipeline and leaves it when it reaches the component downstream, enters
+        a Crossbar when it is routed and leaves it once it was sent. The leave tick of a hop the packet has not left
+        yet is -1.
+
+        The hops of a packet are stored in a chain of chunks of chunkHops hops each, taken from a single array('q').
+        A packet gets a new chunk whenever its last one is full, so paths of any length are recorded and a packet
+        only takes the storage of the hops it made. The chunks are allocated up front, the array growing (doubling)
+        once they are all in use. release(uid) forgets the path of a packet that was delivered and recycles its
+        chunks, which bounds the storage of a long run to the packets in flight. The statistics of hopStats() are
+        kept per component as the packets leave it, so they still count the hops of the released packets.
+
+        Components only call the recorder if they are attached to one, the cost of recording being a single
+        attribute check otherwise.
+
+        Arguments:
+            * chunks   : the number of chunks allocated up front
+            * chunkHops: the number of hops stored in a chunk
+
+        Class members:
+            * components: the fullnames of the components, indexed by component id
+            * paths     : a dictionary {packet uid: offset of its first chunk} of the packets whose path is stored
+
+        usage:
+            paths=PathRecorder()
+            paths.attach(platform)
+            env.run(until=10000)
+            paths.path(42) -> [('RingOf6.Processor3.peb', 0, 4), ('RingOf6.Router3.pib', 4, 6), ...]
+            paths.bottlenecks(5) -> the 5 components where packets spent the most ticks on average
+            paths.release(42) -> once packet 42 was delivered and its path is no longer needed
+    """
+
+    hopSize=3
+    headerSize=3 #next chunk, then for the first chunk of a path: the hop count and the last chunk
+
+    def __init__(self, chunks=1024, chunkHops=8):
+
+        self.chunkHops=chunkHops
+        self.chunkSize=self.headerSize+self.hopSize*chunkHops
+        self.components=[]
+        self.paths={}
+        self.data=array('q', bytes(8*self.chunkSize*max(chunks, 1)))
+        self.allocated=0
+        self.freeChunks=[]
+        self.leftHops=[]
+        self.leftTicks=[]
+        self.maxTicks=[]
+
+    def attach(self, root):
+        """registers root and all the components below it and makes them record the hops of the packets"""
+
+        for component in root.walk():
+            if component.pathRecorder is not self:
+                component.pathId=len(self.components)
+                component.pathRecorder=self
+                self.components.append(component.fullname)
+                self.leftHops.append(0)
+                self.leftTicks.append(0)
+                self.maxTicks.append(0)
+
+    def _newChunk(self):
+
+        if self.freeChunks:
+            chunk=self.freeChunks.pop()
+        else:
+            chunk=self.allocated
+            if chunk==len(self.data):
+                self.data.frombytes(bytes(8*len(self.data)))
+            self.allocated+=self.chunkSize
+        self.data[chunk]=-1
+        return chunk
+
+    def _chunks(self, first):
+
+        chunks=[]
+        chunk=first
+        while chunk>=0:
+            chunks.append(chunk)
+            chunk=self.data[chunk]
+        return chunks
+
+    def enter(self, component, pkt):
+
+        uid=int(pkt.uid)
+        data=self.data
+        first=self.paths.get(uid)
+
+        if first is None:
+            first=last=self.paths[uid]=self._newChunk()
+            data[first+1]=0
+            data[first+2]=first
+            count=0
+        else:
+            count=data[first+1]
+            last=data[first+2]
+
+            # a packet re-routed by a crossbar (eg after a failed arbitration) is still in the same hop
+            i=last+self.headerSize+(count-1)%self.chunkHops*self.hopSize
+            if data[i]==component.pathId and data[i+2]<0:
+                return
+
+            if count%self.chunkHops==0:
+                data[last]=data[first+2]=last=self._newChunk()
+
+        i=last+self.headerSize+count%self.chunkHops*self.hopSize
+        data[i]=component.pathId
+        data[i+1]=component.env.now
+        data[i+2]=-1
+        data[first+1]=count+1
+
+    def leave(self, component, pkt):
+
+        first=self.paths.get(int(pkt.uid))
+        if first is None:
+            return
+
+        data=self.data
+        count=data[first+1]
+        last=data[first+2]
+
+        # the hop left is usually the last one, or close to it when the packet has already entered the next component
+        chunks=[(last, (count-1)%self.chunkHops+1)]
+        while chunks:
+            chunk, hops=chunks.pop()
+            for i in range(chunk+self.headerSize+(hops-1)*self.hopSize, chunk+self.headerSize-1, -self.hopSize):
+                if data[i]==component.pathId and data[i+2]<0:
+                    data[i+2]=component.env.now
+                    ticks=data[i+2]-data[i+1]
+                    self.leftHops[data[i]]+=1
+                    self.leftTicks[data[i]]+=ticks
+                    self.maxTicks[data[i]]=max(self.maxTicks[data[i]], ticks)
+                    return
+            if chunk==last and last!=first:
+                chunks=[(earlier, self.chunkHops) for earlier in self._chunks(first)[:-1]]
+
+    def release(self, uid):
+        """forgets the path of a packet and recycles its storage, the hops it left still count in hopStats()"""
+
+        first=self.paths.pop(int(uid), None)
+        if first is not None:
+            self.freeChunks+=self._chunks(first)
+
+    def hops(self, uid):
+        """generator over the (component id, enter tick, leave tick) of the hops of a packet"""
+
+        first=self.paths.get(int(uid))
+        if first is None:
+            return
+
+        count=self.data[first+1]
+        for chunk in self._chunks(first):
+            start=chunk+self.headerSize
+            for i in range(start, start+min(count, self.chunkHops)*self.hopSize, self.hopSize):
+                yield self.data[i], self.data[i+1], self.data[i+2]
+            count-=self.chunkHops
+
+    def path(self, uid):
+        """returns the list of (fullname, enter tick, leave tick) of the hops of a packet"""
+
+        return [(self.components[componentId], enter, leave) for componentId, enter, leave in self.hops(uid)]
+
+    def hopStats(self):
+        """returns a dictionary {fullname: (hops, average ticks, max ticks)} over the hops left by the packets"""
+
+        return {self.components[c]:(self.leftHops[c], self.leftTicks[c]/self.leftHops[c], self.maxTicks[c])
+                for c in range(len(self.components)) if self.leftHops[c]}
+
+    def bottlenecks(self, count=10):
+        """returns the (fullname, (hops, average ticks, max ticks)) of the count components packets spent the most
+            ticks in on average"""
+
+        return sorted(self.hopStats().items(), key=lambda stats: stats[1][1], reverse=True)[:count]
@@ -0,0 +1,535 @@
+"""A compact binary recorder for the events of Buffers, Pipelines and Crossbars, and its offline decoder"""
+
+import argparse
+import bisect
+import json
+import lzma
+import struct
+import sys
+import zlib
+from array import array
+
+#---------------------------------------------------------------------------------
+# Event codes and the Log messages they are rendered into
+#---------------------------------------------------------------------------------
+# Every record holds (tick, component id, code, packet uid, port, value). The meaning of port and value depends
+# on the code. For codes whose message needs more than two numbers, value packs an outPort in its 16 low bits
+# and a mask of inPorts (or an interned string) above them.
+
+BUFFER_PUT=1                # value: post put delay
+BUFFER_GET_REQUEST=2        # port: id of the calling component, -1 if none
+BUFFER_GET=3                # value: post get delay
+BUFFER_PEEK_REQUEST=4       # port: id of the calling component, -1 if none
+BUFFER_GET_DELAYS=5         # port: pre get delay, value: post get delay
+PIPELINE_PUT=10             # value: post put delay
+PIPELINE_SENT=11
+CREDIT_RECEIVED=12
+CREDIT_DISPATCHED=13        # recorded by the buffer dispatching the credit
+CREDIT_CONSUMED=14          # value: remaining credits
+XBAR_ROUTED=20              # port: inPort, value: outPort
+XBAR_UNMASK_CREATED=21      # port: inPort, value: outPort + unMask event type name (interned)
+XBAR_ARB_READY=22           # value: outPort
+XBAR_ARB_WAIT=23            # value: outPort
+XBAR_ARB_RETRY=24
+XBAR_SENT=25                # port: inPort, value: outPort
+XBAR_PEEK_REFRESH=26        # port: inPort
+XBAR_GET_REQUEST=27         # value: outPort
+XBAR_ELECTED_RANDOM=30      # port: inPort, value: outPort
+XBAR_ELECTED_RR=31          # port: inPort, value: outPort
+XBAR_ELECTED_RR_UNMASKED=32 # port: inPort, value: outPort + mask of the unmasked inPorts (interned)
+XBAR_ELECTED_WRR=33         # port: inPort, value: outPort
+XBAR_ELECTED_FP=34          # port: inPort, value: outPort
+XBAR_ELECTED_FP_UNMASKED=35 # port: inPort, value: outPort + mask of the unmasked inPorts (interned)
+XBAR_PORTS_UNMASKED=36      # value: outPort + mask of the unmasked inPorts (interned)
+
+# records whose value holds the id of an interned inPort mask above the outPort
+maskCodes=(XBAR_ELECTED_RR_UNMASKED, XBAR_ELECTED_FP_UNMASKED, XBAR_PORTS_UNMASKED)
+
+traceMessages={
+    BUFFER_PUT:               ('INFO', "Started writing packet {uid} into the buffer. This will take {value} ticks"),
+    BUFFER_GET_REQUEST:       ('DEBUG', "Read request initiated{byCaller}"),
+    BUFFER_GET:               ('INFO', "Started reading packet {uid} from the buffer. This will take {value} ticks"),
+    BUFFER_PEEK_REQUEST:      ('DEBUG', "Peek request initiated{byCaller}"),
+    BUFFER_GET_DELAYS:        ('DEBUG', "PreGetDelay is {port} ticks. PostGetDelay is {value} ticks"),
+    PIPELINE_PUT:             ('INFO', "Started sending packet {uid} down the pipeline. This will take {value} simTicks"),
+    PIPELINE_SENT:            ('INFO', "Finished sending Packet {uid} down the pipeline"),
+    CREDIT_RECEIVED:          ('INFO', "credit received from downstream"),
+    CREDIT_DISPATCHED:        ('INFO', "credit dispatched"),
+    CREDIT_CONSUMED:          ('DEBUG', "credit consumed. {value} remaining credits"),
+    XBAR_ROUTED:              ('DEBUG', "Packet {uid} from {inPortName} was routed to {outPortName}"),
+    XBAR_UNMASK_CREATED:      ('DEBUG', "Creating unMask event ({string}) for packet {uid} to proceed from {inPortName} to {outPortName}."),
+    XBAR_ARB_READY:           ('DEBUG', "One or more Packets for outPort {outPortName} are unMasked. Arbitration will now proceed"),
+    XBAR_ARB_WAIT:            ('DEBUG', "No unMasked Packets for outPort {outPortName}. Adding callbacks to schedule an arbitration Once any packet is unMasked."),
+    XBAR_ARB_RETRY:           ('DEBUG', "Arbitration is re-scheduled for the next cycle"),
+    XBAR_SENT:                ('DEBUG', "Finished Sending Packet {uid} sent from inPort {port} towards outPort {outPort}. Cleaning up and refreshing Peek and UnMask Events"),
+    XBAR_PEEK_REFRESH:        ('DEBUG', "Refreshing Peek onto inPort {port}."),
+    XBAR_GET_REQUEST:         ('DEBUG', "Get from outPort {outPort} is Requested"),
+    XBAR_ELECTED_RANDOM:      ('INFO', "Random Arbitration elected packet {uid} from {inPortName} to proceed towards {outPortName}"),
+    XBAR_ELECTED_RR:          ('INFO', "RoundRobin Arbitration elected packet {uid} from {inPortName} to proceed towards {outPortName}"),
+    XBAR_ELECTED_RR_UNMASKED: ('INFO', "RoundRobin arbitration between unmasked ports {unmaskedNames} elected packet {uid} from {inPortName} to proceed towards {outPortName}"),
+    XBAR_ELECTED_WRR:         ('INFO', "Weighted RoundRobin arbitration elected packet {uid} from {inPortName} to proceed towards {outPortName}"),
+    XBAR_ELECTED_FP:          ('INFO', "FixedPriority Arbitration elected packet {uid} from {inPortName} to proceed towards {outPortName}"),
+    XBAR_ELECTED_FP_UNMASKED: ('INFO', "Fixed Priority arbitration between unmasked ports {unmaskedNames} elected packet {uid} from {inPortName} to proceed towards {outPortName}"),
+    XBAR_PORTS_UNMASKED:      ('DEBUG', "Ports {unmaskedPorts} are unmasked for outPort {outPort}"),
+}
+
+# the levels of the logging module, as printed by its default format
+levelNames={'FATAL_ERROR':'ERROR', 'WARNING':'WARNING', 'INFO':'INFO', 'DEBUG':'DEBUG'}
+levelOrder=['DEBUG', 'INFO', 'WARNING', 'FATAL_ERROR']
+
+#---------------------------------------------------------------------------------
+# Recorder
+#---------------------------------------------------------------------------------
+class TraceRecorder(object):
+    """ Records the events of the components it is attached to as fixed width records of 6 integers (tick, component
+        id, event code, packet uid, port, value) in an array, instead of text messages.
+
+        The components write to the recorder wherever they call Log() for one of the events listed in traceMessages,
+        whatever the logging level. The offline decoder (messages(), or python -m simpyExtensions.trace trace.bin)
+        renders the records into the messages these Log() calls produce.
+
+        In ring mode (capacity set) the array is allocated once and only the last capacity records are kept, eg the
+        events leading to a deadlock. Otherwise the array grows with the trace.
+
+        Packet uids must be integers (or strings of an integer, as for BasePacket).
+
+        Arguments:
+            * capacity: the number of records kept in ring mode, None to keep all of them
+
+        Class members:
+            * components: a list of (fullname, name, inPortNames, outPortNames) indexed by component id
+            * strings   : a list of interned strings (event type names, inPort masks in hexadecimal) referred to by
+                          some records. Interning the masks keeps the records of crossbars of any radix within 64 bits
+            * count     : the number of records written since the recorder was created
+
+        usage:
+            tracer=TraceRecorder(capacity=100000)
+            tracer.attach(platform)
+            env.run(until=10000)
+            tracer.save('trace.bin')
+
+            for msgtype, fullname, msg in TraceRecorder.load('trace.bin').messages(level='INFO'):
+                print(msg)
+    """
+
+    recordSize=6
+    magic=b'S4CTRACE'
+
+    def __init__(self, capacity=None):
+
+        self.capacity=capacity
+        self.components=[]
+        self.strings=[]
+        self.stringIds={}
+        self.maskIds={}
+        self.count=0
+
+        if capacity is None:
+            self.data=array('q')
+        else:
+            self.data=array('q', bytes(8*self.recordSize*capacity))
+
+    def attach(self, root):
+        """registers root and all the components below it and makes them write into the recorder"""
+
+        for component in root.walk():
+            self.componentId(component)
+            component.tracer=self
+
+    def componentId(self, component):
+        """returns the id of a component in the trace, registering it if needed"""
+
+        if component.tracer is self:
+            return component.traceId
+
+        component.traceId=len(self.components)
+        component.tracer=self
+        self.components.append((component.fullname, component.name, self._portNames(component.toUp) if hasattr(component, 'toUp') else {},
+                                self._portNames(component.toDn) if hasattr(component, 'toDn') else {}))
+        return component.traceId
+
+    @staticmethod
+    def _portNames(connection):
+
+        if isinstance(connection, dict):
+            return {str(port):c.name for port, c in connection.items() if c is not None}
+        return {'0':connection.name}
+
+    def stringId(self, string):
+
+        if string not in self.stringIds:
+            self.stringIds[string]=len(self.strings)
+            self.strings.append(string)
+        return self.stringIds[string]
+
+    def maskId(self, mask):
+        """returns the id of a mask of inPorts interned among the strings, stored above the outPort in the value of
+            a record"""
+
+        if mask not in self.maskIds:
+            self.maskIds[mask]=self.stringId('{:x}'.format(mask))
+        return self.maskIds[mask]
+
+    def record(self, component, code, uid=-1, port=-1, value=-1):
+
+        if self.capacity is None:
+            self.data.extend((component.env.now, component.traceId, code, int(uid), port, value))
+        else:
+            i=(self.count%self.capacity)*self.recordSize
+            data=self.data
+            data[i]=component.env.now
+            data[i+1]=component.traceId
+            data[i+2]=code
+            data[i+3]=int(uid)
+            data[i+4]=port
+            data[i+5]=value
+        self.count+=1
+
+    def records(self):
+        """generator over the records kept, oldest first, as tuples (tick, component id, code, uid, port, value)"""
+
+        size=self.recordSize
+        kept=len(self.data)//size if self.capacity is None else min(self.count, self.capacity)
+        first=0 if self.capacity is None or self.count<=self.capacity else self.count%self.capacity
+
+        for n in range(kept):
+            i=((first+n)%kept)*size
+            yield tuple(self.data[i:i+size])
+
+    def save(self, filename):
+        """writes the records kept, oldest first, and the names needed to decode them into a binary file"""
+
+        header=json.dumps({'byteorder':sys.byteorder, 'components':self.components, 'strings':self.strings,
+                           'count':self.count}).encode()
+
+        with open(filename, 'wb') as f:
+            f.write(self.magic)
+            f.write(len(header).to_bytes(4, 'little'))
+            f.write(header)
+            ordered=array('q')
+            for record in self.records():
+                ordered.extend(record)
+            ordered.tofile(f)
+
+    @classmethod
+    def load(cls, filename):
+        """returns a recorder holding the records of a file written by save()"""
+
+        with open(filename, 'rb') as f:
+            if f.read(len(cls.magic))!=cls.magic:
+                raise RuntimeError("ERROR: {} is not a trace file".format(filename))
+            header=json.loads(f.read(int.from_bytes(f.read(4), 'little')))
+            data=array('q', f.read())
+
+        if header['byteorder']!=sys.byteorder:
+            data.byteswap()
+
+        recorder=cls()
+        recorder.data=data
+        recorder.components=[tuple(c) for c in header['components']]
+        recorder.strings=header['strings']
+        recorder.count=header['count']
+        return recorder
+
+    #---------------------------------------------------------------------------------
+    # Decoder
+    #---------------------------------------------------------------------------------
+    def render(self, record):
+        """returns (msgtype, fullname, message) for a record, the message being the one Log() outputs"""
+
+        tick, componentId, code, uid, port, value=record
+        fullname, name, inPortNames, outPortNames=self.components[componentId]
+        msgtype, template=traceMessages[code]
+
+        outPort=value&0xFFFF if value>=0 else value
+        stringId=value>>16 if value>=0 else 0
+        mask=int(self.strings[stringId], 16) if code in maskCodes else 0
+        unmasked=[p for p in range(mask.bit_length()) if mask>>p&1]
+
+        fields={'uid':uid, 'port':port, 'value':value, 'outPort':outPort,
+                'inPortName':inPortNames.get(str(port), inPortNames.get('0')) if len(inPortNames)<=1 else inPortNames.get(str(port)),
+                'outPortName':outPortNames.get(str(outPort), outPortNames.get('0')) if len(outPortNames)<=1 else outPortNames.get(str(outPort)),
+                'string':self.strings[stringId] if code==XBAR_UNMASK_CREATED else None,
+                'unmaskedPorts':unmasked,
+                'unmaskedNames':[inPortNames[str(p)] for p in unmasked] if len(inPortNames)>1 else list(inPortNames.values()),
+                'byCaller':' by {}'.format(self.components[port][1]) if port>=0 else ''}
+
+        return msgtype, fullname, '[@%d]%s : %s' % (tick, fullname, template.format(**fields))
+
+    def select(self, start=None, end=None, uid=None, component=None):
+        """generator over the records between the ticks start and end (both included), of the packet uid and of the
+            component (a fullname or an id), oldest first. Criteria left to None select all the records"""
+
+        component=self._componentIndex(component)
+        uid=int(uid) if uid is not None else None
+
+        for record in self.records():
+            if (start is None or record[0]>=start) and (end is None or record[0]<=end) and \
+               (uid is None or record[3]==uid) and (component is None or record[1]==component):
+                yield record
+
+    def _componentIndex(self, component):
+
+        if isinstance(component, str):
+            # an unknown fullname selects nothing
+            return next((i for i, c in enumerate(self.components) if c[0]==component), -2)
+        return component
+
+    def messages(self, level='DEBUG', **selection):
+        """generator over (msgtype, fullname, message) for the records of type level or above, oldest first. The
+            records may be selected as by select()"""
+
+        minimum=levelOrder.index(level)
+
+        for record in self.select(**selection):
+            msgtype, fullname, message=self.render(record)
+            if levelOrder.index(msgtype)>=minimum:
+                yield msgtype, fullname, message
+
+#---------------------------------------------------------------------------------
+# Chunked compressed traces
+#---------------------------------------------------------------------------------
+compressors={'zlib':(zlib.compress, zlib.decompress), 'lzma':(lzma.compress, lzma.decompress)}
+
+class ChunkBloom(object):
+    """ The bloom filter of the component ids and packet uids of the records of a chunk """
+
+    bits=4096
+    hashes=3
+
+    def __init__(self, data=None):
+
+        self.data=bytearray(self.bits//8) if data is None else bytearray(data)
+
+    @classmethod
+    def positions(cls, key):
+
+        # multiplicative hashing of the key (component ids are even, packet uids odd), independent of the process
+        h=(key*0x9E3779B97F4A7C15+0x632BE59BD9B4E019)&0xFFFFFFFFFFFFFFFF
+        return [(h>>(20*i))%cls.bits for i in range(cls.hashes)]
+
+    @staticmethod
+    def componentKey(componentId):
+
+        return 2*componentId
+
+    @staticmethod
+    def uidKey(uid):
+
+        return 2*int(uid)+1
+
+    def add(self, key):
+
+        for position in self.positions(key):
+            self.data[position>>3]|=1<<(position&7)
+
+    def __contains__(self, key):
+
+        return all(self.data[position>>3]>>(position&7)&1 for position in self.positions(key))
+
+class ChunkedTraceRecorder(TraceRecorder):
+    """ A TraceRecorder streaming its records to a file as compressed chunks of chunkRecords records while the
+        simulation runs, so that a trace can grow far beyond the memory of the machine.
+
+        Every chunk starts with the tick range of its records, their number and a bloom filter (ChunkBloom) of
+        their component ids and packet uids. The names needed to decode the records and the offsets of the chunks
+        are written at the end of the file by close(). A ChunkedTrace reader only decompresses the chunks that may
+        hold the records of a time window, a component or a packet.
+
+        Arguments:
+            * filename    : the trace file
+            * chunkRecords: the number of records per chunk
+            * compression : 'zlib' or 'lzma'
+
+        usage:
+            tracer=ChunkedTraceRecorder('trace.s4c', compression='lzma')
+            tracer.attach(platform)
+            env.run(until=10000)
+            tracer.close()
+
+            trace=ChunkedTrace('trace.s4c')
+            for record in trace.select(start=5000, end=6000, uid=42):
+                print(trace.render(record))
+        or from the command line:
+            python -m simpyExtensions.trace trace.s4c --start 5000 --end 6000 --uid 42
+    """
+
+    magic=b'S4CTRCHK'
+    chunkHeader=struct.Struct('<qqqq')  # first tick, last tick, number of records, compressed size
+
+    def __init__(self, filename, chunkRecords=65536, compression='zlib'):
+
+        TraceRecorder.__init__(self)
+
+        if compression not in compressors:
+            raise RuntimeError("ERROR: unsupported trace compression {}, use one of {}".format(compression, list(compressors)))
+
+        self.filename=filename
+        self.chunkRecords=chunkRecords
+        self.compression=compression
+        self.compress=compressors[compression][0]
+        self.chunkOffsets=[]
+        self.file=open(filename, 'wb')
+        self.file.write(self.magic)
+
+    def record(self, component, code, uid=-1, port=-1, value=-1):
+
+        self.data.extend((component.env.now, component.traceId, code, int(uid), port, value))
+        self.count+=1
+        if len(self.data)>=self.chunkRecords*self.recordSize:
+            self._writeChunk()
+
+    def _writeChunk(self):
+
+        data=self.data
+        if not data:
+            return
+
+        bloom=ChunkBloom()
+        for componentId in set(data[1::self.recordSize]):
+            bloom.add(ChunkBloom.componentKey(componentId))
+        for uid in set(data[3::self.recordSize]):
+            if uid>=0:
+                bloom.add(ChunkBloom.uidKey(uid))
+
+        payload=self.compress(data.tobytes())
+        self.chunkOffsets.append(self.file.tell())
+        self.file.write(self.chunkHeader.pack(data[0], data[-self.recordSize], len(data)//self.recordSize, len(payload)))
+        self.file.write(bloom.data)
+        self.file.write(payload)
+        self.data=array('q')
+
+    def records(self):
+        """the records are on disk, read them with ChunkedTrace"""
+
+        raise RuntimeError("ERROR: the records of a ChunkedTraceRecorder are read from its file with ChunkedTrace, once closed")
+
+    def save(self, filename):
+
+        raise RuntimeError("ERROR: a ChunkedTraceRecorder writes its records to {} as they come, close() it instead".format(self.filename))
+
+    def close(self):
+        """writes the remaining records and the footer holding the names and the chunk offsets"""
+
+        if self.file.closed:
+            return
+
+        self._writeChunk()
+        footer=json.dumps({'byteorder':sys.byteorder, 'components':self.components, 'strings':self.strings,
+                           'count':self.count, 'compression':self.compression, 'chunks':self.chunkOffsets}).encode()
+        self.file.write(footer)
+        self.file.write(len(footer).to_bytes(8, 'little'))
+        self.file.write(self.magic)
+        self.file.close()
+
+class ChunkedTrace(TraceRecorder):
+    """ Reads a file written by ChunkedTraceRecorder, only decompressing the chunks that may hold the records
+        selected. The chunk headers are read when the file is opened, chunks are read on demand.
+
+        Arguments:
+            * filename: the trace file
+
+        Class members:
+            * chunks: a list of (offset, first tick, last tick, records, compressed size, bloom) in time order
+
+        usage: see ChunkedTraceRecorder
+    """
+
+    def __init__(self, filename):
+
+        TraceRecorder.__init__(self)
+        self.filename=filename
+        self.chunks=[]
+        magic=ChunkedTraceRecorder.magic
+        chunkHeader=ChunkedTraceRecorder.chunkHeader
+
+        with open(filename, 'rb') as f:
+            if f.read(len(magic))!=magic:
+                raise RuntimeError("ERROR: {} is not a chunked trace file".format(filename))
+            f.seek(-len(magic)-8, 2)
+            footerSize=int.from_bytes(f.read(8), 'little')
+            if f.read(len(magic))!=magic:
+                raise RuntimeError("ERROR: {} is truncated, its recorder was not closed".format(filename))
+            f.seek(-len(magic)-8-footerSize, 2)
+            footer=json.loads(f.read(footerSize))
+
+            for offset in footer['chunks']:
+                f.seek(offset)
+                firstTick, lastTick, count, size=chunkHeader.unpack(f.read(chunkHeader.size))
+                self.chunks.append((offset, firstTick, lastTick, count, size, ChunkBloom(f.read(ChunkBloom.bits//8))))
+
+        self.swap=footer['byteorder']!=sys.byteorder
+        self.decompress=compressors[footer['compression']][1]
+        self.components=[tuple(c) for c in footer['components']]
+        self.strings=footer['strings']
+        self.count=footer['count']
+        self.lastTicks=[chunk[2] for chunk in self.chunks]
+
+    def _readChunk(self, f, chunk):
+
+        offset, firstTick, lastTick, count, size, bloom=chunk
+        f.seek(offset+ChunkedTraceRecorder.chunkHeader.size+ChunkBloom.bits//8)
+        data=array('q', self.decompress(f.read(size)))
+        if self.swap:
+            data.byteswap()
+        return data
+
+    def select(self, start=None, end=None, uid=None, component=None):
+        """see TraceRecorder.select(), the chunks that cannot hold any of the records selected are not read"""
+
+        component=self._componentIndex(component)
+        if component==-2:
+            return
+
+        keys=([ChunkBloom.componentKey(component)] if component is not None else [])+([ChunkBloom.uidKey(uid)] if uid is not None else [])
+        uid=int(uid) if uid is not None else None
+        size=self.recordSize
+
+        # the chunks are in time order: skip straight to the first one that may hold start
+        first=bisect.bisect_left(self.lastTicks, start) if start is not None else 0
+
+        with open(self.filename, 'rb') as f:
+            for chunk in self.chunks[first:]:
+                if end is not None and chunk[1]>end:
+                    break
+                if not all(key in chunk[5] for key in keys):
+                    continue
+
+                data=self._readChunk(f, chunk)
+                for i in range(0, len(data), size):
+                    record=tuple(data[i:i+size])
+                    if (start is not None and record[0]<start) or (end is not None and record[0]>end) or \
+                       (uid is not None and record[3]!=uid) or (component is not None and record[1]!=component):
+                        continue
+                    yield record
+
+    def records(self):
+
+        return self.select()
+
+def openTrace(filename):
+    """returns a reader of a trace file, either a TraceRecorder (written by save()) or a ChunkedTrace"""
+
+    with open(filename, 'rb') as f:
+        chunked=f.read(len(ChunkedTraceRecorder.magic))==ChunkedTraceRecorder.magic
+
+    return ChunkedTrace(filename) if chunked else TraceRecorder.load(filename)
+
+def main(argv=None):
+
+    parser=argparse.ArgumentParser(description="Renders a binary trace into the messages of the components Log()")
+    parser.add_argument('trace', help="a file written by TraceRecorder.save() or ChunkedTraceRecorder")
+    parser.add_argument('--level', default='DEBUG', choices=levelOrder, help="the lowest message type to render")
+    parser.add_argument('--start', type=int, default=None, help="the first tick rendered")
+    parser.add_argument('--end', type=int, default=None, help="the last tick rendered")
+    parser.add_argument('--uid', type=int, default=None, help="only render the records of this packet")
+    parser.add_argument('--component', default=None, help="only render the records of this component fullname")
+    args=parser.parse_args(argv)
+
+    # same layout as the default format of the logging module
+    for msgtype, fullname, message in openTrace(args.trace).messages(args.level, start=args.start, end=args.end,
+                                                                      uid=args.uid, component=args.component):
+        print('{}:{}:{}'.format(levelNames[msgtype], fullname, message))
+
+if __name__=='__main__':
+    main()
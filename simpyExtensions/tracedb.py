@@ -0,0 +1,208 @@
+"""An indexed SQLite database of the events of a run, loaded from a binary trace or a log file, and its queries"""
+
+import argparse
+import re
+import sqlite3
+from simpyExtensions.trace import TraceRecorder, ChunkedTraceRecorder, openTrace, levelNames, levelOrder
+
+#---------------------------------------------------------------------------------
+# Trace database
+#---------------------------------------------------------------------------------
+# the messages of the components, as printed by the default format of the logging module
+logLine=re.compile(r'^(\w+):[^:]*:\[@(\d+)\](\S+) : (.*)$')
+packetUid=re.compile(r'[Pp]acket (\d+)')
+
+schema="""
+CREATE TABLE IF NOT EXISTS components (id INTEGER PRIMARY KEY, fullname TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS events (tick INTEGER NOT NULL, component INTEGER NOT NULL REFERENCES components(id),
+    msgtype TEXT NOT NULL, uid INTEGER, code INTEGER, port INTEGER, value INTEGER, message TEXT NOT NULL);
+"""
+
+indexes={'eventsByUid':"events (uid, tick)", 'eventsByComponent':"events (component, tick)", 'eventsByTick':"events (tick)"}
+
+class TraceDatabase(object):
+    """ A SQLite file holding one row per event of a run, indexed by packet uid, component and tick, so that the
+        history of a packet or of a component can be queried without scanning the whole trace.
+
+        The events are imported either from a binary trace (a TraceRecorder, a file written by its save() or by a
+        ChunkedTraceRecorder) or from a log file written with the default format of the logging module. Events of a
+        binary trace keep their code, port and value. The packet uid of a log message is the number following
+        'packet' in the message, if any.
+
+        Every query returns a list of (tick, fullname, msgtype, message) in time order, events of the same tick
+        being in the order they were recorded.
+
+        Arguments:
+            * filename: the SQLite file, created if it does not exist
+
+        Methods:
+            * importTrace(trace) : imports a TraceRecorder or a binary trace file
+            * importLog(filename): imports a log file
+            * packetLifetime(uid): all the events of a packet
+            * timeline(fullname, start, end): the events of a component and its sub-components, optionally between
+                                              two ticks
+            * window(start, end, level): the events between two ticks (both included), of type level or above
+
+        usage:
+            db=TraceDatabase('run.db')
+            db.importTrace('trace.bin')
+            for tick, fullname, msgtype, message in db.packetLifetime(123456):
+                print(message)
+
+        or from the command line:
+            python -m simpyExtensions.tracedb run.db import trace.bin
+            python -m simpyExtensions.tracedb run.db packet 123456
+            python -m simpyExtensions.tracedb run.db component RingOf6.Router3.reaArb --start 1000 --end 2000
+            python -m simpyExtensions.tracedb run.db window 1000 2000 --level INFO
+    """
+
+    def __init__(self, filename):
+
+        self.filename=filename
+        self.connection=sqlite3.connect(filename)
+        self.connection.executescript(schema)
+        self.componentIds=dict((fullname, i) for i, fullname in self.connection.execute("SELECT id, fullname FROM components"))
+
+    def close(self):
+
+        self.connection.close()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+
+        self.close()
+
+    def componentId(self, fullname):
+
+        if fullname not in self.componentIds:
+            cursor=self.connection.execute("INSERT INTO components (fullname) VALUES (?)", (fullname,))
+            self.componentIds[fullname]=cursor.lastrowid
+        return self.componentIds[fullname]
+
+    def _insert(self, rows):
+        """inserts (tick, component id, msgtype, uid, code, port, value, message) rows in a single transaction, the
+            indexes being rebuilt once afterwards"""
+
+        with self.connection:
+            for name in indexes:
+                self.connection.execute("DROP INDEX IF EXISTS "+name)
+            self.connection.executemany("INSERT INTO events VALUES (?,?,?,?,?,?,?,?)", rows)
+            for name, columns in indexes.items():
+                self.connection.execute("CREATE INDEX {} ON {}".format(name, columns))
+
+    def importTrace(self, trace):
+        """imports the records of a TraceRecorder, or of a file written by TraceRecorder.save() or ChunkedTraceRecorder"""
+
+        recorder=openTrace(trace) if isinstance(trace, str) else trace
+        ids=[self.componentId(component[0]) for component in recorder.components]
+
+        def rows():
+            for record in recorder.records():
+                tick, componentId, code, uid, port, value=record
+                msgtype, fullname, message=recorder.render(record)
+                yield tick, ids[componentId], msgtype, uid if uid>=0 else None, code, port, value, message
+
+        self._insert(rows())
+
+    def importLog(self, filename):
+        """imports the component messages of a log file, the other lines (eg infolist dumps) are skipped"""
+
+        msgtypes={name:msgtype for msgtype, name in levelNames.items()}
+
+        def rows():
+            with open(filename) as f:
+                for line in f:
+                    match=logLine.match(line.rstrip('\n'))
+                    if match is None or match.group(1) not in msgtypes:
+                        continue
+                    level, tick, fullname, msg=match.groups()
+                    uid=packetUid.search(msg)
+                    yield int(tick), self.componentId(fullname), msgtypes[level], int(uid.group(1)) if uid else None, \
+                        None, None, None, '[@%s]%s : %s' % (tick, fullname, msg)
+
+        self._insert(rows())
+
+    #---------------------------------------------------------------------------------
+    # Queries
+    #---------------------------------------------------------------------------------
+    def _select(self, where, parameters):
+
+        return self.connection.execute("SELECT tick, fullname, msgtype, message FROM events JOIN components ON component=id WHERE "
+                                       +where+" ORDER BY tick, events.rowid", parameters).fetchall()
+
+    def packetLifetime(self, uid):
+
+        return self._select("uid=?", (int(uid),))
+
+    def timeline(self, fullname, start=None, end=None):
+
+        ids=[i for name, i in self.componentIds.items() if name==fullname or name.startswith(fullname+'.')]
+        where="component IN ({})".format(','.join('?'*len(ids)))
+        parameters=list(ids)
+
+        if start is not None:
+            where+=" AND tick>=?"
+            parameters.append(start)
+        if end is not None:
+            where+=" AND tick<=?"
+            parameters.append(end)
+
+        return self._select(where, parameters)
+
+    def window(self, start, end, level='DEBUG'):
+
+        msgtypes=levelOrder[levelOrder.index(level):]
+
+        return self._select("tick BETWEEN ? AND ? AND msgtype IN ({})".format(','.join('?'*len(msgtypes))),
+                            [start, end]+msgtypes)
+
+def main(argv=None):
+
+    parser=argparse.ArgumentParser(description="Loads the events of a run into a SQLite database and queries them")
+    parser.add_argument('database', help="the SQLite file")
+    commands=parser.add_subparsers(dest='command', required=True)
+
+    load=commands.add_parser('import', help="imports a binary trace (TraceRecorder.save() or ChunkedTraceRecorder) or a log file")
+    load.add_argument('filename')
+
+    packet=commands.add_parser('packet', help="prints the events of a packet")
+    packet.add_argument('uid', type=int)
+
+    component=commands.add_parser('component', help="prints the events of a component and its sub-components")
+    component.add_argument('fullname')
+    component.add_argument('--start', type=int, default=None)
+    component.add_argument('--end', type=int, default=None)
+
+    window=commands.add_parser('window', help="prints the events between two ticks")
+    window.add_argument('start', type=int)
+    window.add_argument('end', type=int)
+    window.add_argument('--level', default='DEBUG', choices=levelOrder)
+
+    args=parser.parse_args(argv)
+
+    with TraceDatabase(args.database) as db:
+        if args.command=='import':
+            with open(args.filename, 'rb') as f:
+                binary=f.read(len(TraceRecorder.magic)) in (TraceRecorder.magic, ChunkedTraceRecorder.magic)
+            if binary:
+                db.importTrace(args.filename)
+            else:
+                db.importLog(args.filename)
+            return
+
+        if args.command=='packet':
+            events=db.packetLifetime(args.uid)
+        elif args.command=='component':
+            events=db.timeline(args.fullname, args.start, args.end)
+        else:
+            events=db.window(args.start, args.end, args.level)
+
+        # same layout as the default format of the logging module
+        for tick, fullname, msgtype, message in events:
+            print('{}:{}:{}'.format(levelNames[msgtype], fullname, message))
+
+if __name__=='__main__':
+    main()
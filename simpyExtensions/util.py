@@ -16,6 +16,7 @@ from simpy.resources import base
 from simpy.core import BoundClass, Environment, Event
 import time
 from simpy.events import PENDING, EventPriority, URGENT, NORMAL
+from simpyExtensions.trace import XBAR_GET_REQUEST
 
 ResourceType = TypeVar('ResourceType', bound='BaseResource')
 
@@ -25,6 +26,8 @@ class NewEvent(Event):
     of the event to occur at some point in time. 
 
     """
+    pool=None
+
     def __init__(self, env: 'Environment',item=None,caller=None):
         super().__init__(env)
         self.item=item
@@ -47,6 +50,81 @@ class NewEvent(Event):
         self.env.schedule(self,delay=delay)
         return self
 
+    def recycle(self, *args) -> None:
+        """Hand the event back to the :class:`EventPool` it was drawn from, if any.
+
+        Only the owner of the event may call this, once nothing else holds a reference
+        to it. It can also be appended to the event's own callbacks.
+
+        """
+        if self.pool is not None:
+            self.pool.release(self)
+
+class EventPool(object):
+    """A recycling pool (free list) for short-lived events of a given NewEvent subclass.
+
+    acquire() re-initializes a previously released event with the same arguments as the
+    class constructor, or creates a new one if the pool is empty. release() only accepts
+    events that have already been processed; they are kept aside and only reset (_value,
+    callbacks, item, caller) and made available again once the simulation time has moved
+    on, so that the remaining callbacks of an event being processed never see it reused.
+
+    usage:
+        pool=EventPool(env,BufferPeek)
+        peek=pool.acquire(buffer,item,caller)
+        ...
+        peek.recycle()
+
+    """
+
+    def __init__(self, env, eventType, maxSize=1024):
+        self.env=env
+        self.eventType=eventType
+        self.maxSize=maxSize
+        self.free=[]
+        self.released=[]
+        self.releaseTime=None
+
+    def acquire(self, *args, **kwargs):
+
+        if self.released and self.env._now>self.releaseTime:
+            self._reclaim()
+
+        if self.free:
+            event=self.free.pop()
+            event.__init__(*args, **kwargs)
+        else:
+            event=self.eventType(*args, **kwargs)
+
+        event.pool=self
+        return event
+
+    def release(self, event) -> None:
+
+        # pending or scheduled events may still be triggered and processed: leave them alone
+        if event.callbacks is not None or event.pool is not self:
+            return
+
+        event.pool=None
+        if len(self.free)+len(self.released)<self.maxSize:
+            self.released.append(event)
+            self.releaseTime=self.env._now
+
+    def _reclaim(self) -> None:
+
+        for event in self.released:
+            event._value=PENDING
+            event.callbacks=[]
+            event.item=None
+            event.caller=None
+            if hasattr(event, 'proc'):
+                event.proc=None
+            if hasattr(event, '_defused'):
+                del event._defused
+
+        self.free+=self.released
+        self.released=[]
+
 class ConcurrentAllOf(NewEvent):
     """
         An event that is successful when a list of events provided as an argument are concurrently successful.
@@ -61,22 +139,42 @@ class ConcurrentAllOf(NewEvent):
         replace that event with a new not-triggered event. When a second check happens, that event may be not triggered 
         and hence prevent the AllOf event from being successful.
 
+        The check keeps count of how many events at the head of the list were found triggered (verified) so each
+        callback resumes from there instead of rescanning the whole list. Only once the count reaches the end of
+        the list is the whole list checked again, from the start, to catch events that were replaced or went back
+        to pending; the count restarts from the first such event. The check callback is never appended twice to
+        the same event.
+
     """
     def __init__(self, env, eventList):
         super().__init__(env)
 
         self.eventList=eventList
+        self.verified=0
         self._check()
 
     def _check(self,event=None):
 
-        for e in range(len(self.eventList)):
+        if self.triggered:
+            return
 
-            if not self.eventList[e].triggered:
-                
-                self.eventList[e].callbacks.append(self._check)
+        while True:
+
+            while self.verified<len(self.eventList) and self.eventList[self.verified].triggered:
+                self.verified+=1
+
+            if self.verified<len(self.eventList):
+                pending=self.eventList[self.verified]
+                if self._check not in pending.callbacks:
+                    pending.callbacks.append(self._check)
                 return
 
+            # all events were found triggered one after the other: make sure they all still are
+            regressed=[e for e in range(len(self.eventList)) if not self.eventList[e].triggered]
+            if not regressed:
+                break
+            self.verified=regressed[0]
+
         self.succeed()
 
 class BufferPeek(NewEvent):
@@ -281,9 +379,11 @@ class CrossbarGet(NewEvent):
 
         self.xbar=xbar
         self.xbar.get_queues[outPort].append(self)
-        self.xbar.Log('DEBUG','Get from outPort {} is Requested'.format(self.item))
+        if self.xbar.tracer:
+            self.xbar.tracer.record(self.xbar, XBAR_GET_REQUEST, value=self.item)
+        self.xbar.Log('DEBUG','Get from outPort {} is Requested', self.item)
 
-        unMaskedInPorts=[inPort for inPort in range(self.xbar.inPorts) if (self.xbar.routes[inPort]==outPort and self.xbar.unMaskEvents[inPort].triggered)]
+        unMaskedInPorts=self.xbar.unMaskedPorts(outPort)
 
         if unMaskedInPorts:
-            self.xbar._schedule_arbitration(self.xbar.unMaskEvents[unMaskedInPorts[0]])
\ No newline at end of file
+            self.xbar._schedule_arbitration(self.xbar.unMaskEvents[(unMaskedInPorts&-unMaskedInPorts).bit_length()-1])
\ No newline at end of file
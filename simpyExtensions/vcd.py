@@ -0,0 +1,174 @@
+"""Writes the signals of the components (buffer occupancy, credits, pipeline busy state, crossbar grants) into a
+    Value Change Dump file that can be opened with a waveform viewer (eg GTKWave)"""
+
+import gzip
+
+#---------------------------------------------------------------------------------
+# VCD writer
+#---------------------------------------------------------------------------------
+class VcdWriter(object):
+    """ Streams the value changes of the signals registered by the components into a VCD file as the simulation
+        runs. Nothing is sampled: a value is only written when a component changes it, so the cost grows with the
+        activity of the platform, not with the simulated time.
+
+        attach() asks every component of a platform to register its signals (see registerSignals() of Buffer,
+        CreditBuffer, Pipeline and Crossbar) and writes the header of the file, one VCD scope per component. The
+        components then call change() when a signal changes. The changes of a tick are only written once the
+        simulation moves to a later tick, keeping the last value of every signal and dropping those that did not
+        change, so a signal that changes back and forth within a tick does not glitch. Lines are written in blocks
+        of bufferSize.
+
+        One VCD time unit is one simpy tick. A value of None is written as x.
+
+        Arguments:
+            * filename  : the VCD file, gzip compressed if it ends with .gz or compress is True
+            * timescale : the VCD timescale of one tick
+            * compress  : True to compress the file with gzip
+            * bufferSize: the number of lines held before they are written to the file
+
+        Methods:
+            * attach(root): registers the signals of root and all the components below it and writes the header
+            * signal(component, name, width, initial): declares a signal, returns its id (used by registerSignals())
+            * change(signal, value): records the new value of a signal at the current tick
+            * close(): writes the pending changes and closes the file
+
+        usage:
+            vcd=VcdWriter('ring.vcd.gz')
+            vcd.attach(platform)
+            env.run(until=10000)
+            vcd.close()
+    """
+
+    def __init__(self, filename, timescale='1ns', compress=False, bufferSize=4096):
+
+        self.filename=filename
+        self.timescale=timescale
+        self.bufferSize=bufferSize
+        self.env=None
+        self.signals=[]
+        self.values=[]
+        self.pending={}
+        self.time=None
+        self.lines=[]
+        self.headerWritten=False
+
+        if compress or filename.endswith('.gz'):
+            self.file=gzip.open(filename, 'wt')
+        else:
+            self.file=open(filename, 'w')
+
+    @staticmethod
+    def _code(index):
+        """returns the VCD identifier of the index-th signal, in base 94 over the printable characters"""
+
+        code=''
+        index+=1
+        while index:
+            index, digit=divmod(index-1, 94)
+            code+=chr(33+digit)
+        return code
+
+    def signal(self, component, name, width=1, initial=0):
+
+        if self.headerWritten:
+            raise RuntimeError("ERROR: signal {}.{} registered after the VCD header of {} was written".format(component.fullname, name, self.filename))
+
+        self.signals.append((component.fullname, name, width, self._code(len(self.signals))))
+        self.values.append(initial)
+        return len(self.signals)-1
+
+    def attach(self, root):
+        """registers the signals of root and all the components below it, makes them record their changes and
+            writes the header of the file. Must be called before the simulation starts"""
+
+        self.env=root.env
+
+        for component in root.walk():
+            component.registerSignals(self)
+            component.vcd=self
+
+        self._writeHeader()
+
+    def _writeHeader(self):
+
+        lines=['$timescale {} $end'.format(self.timescale)]
+
+        # one scope per component, nested along their fullnames
+        scope=[]
+        for fullname, name, width, code in sorted(self.signals, key=lambda s: s[0].split('.')):
+            path=fullname.split('.')
+            common=0
+            while common<min(len(scope), len(path)) and scope[common]==path[common]:
+                common+=1
+            lines+=['$upscope $end']*(len(scope)-common)
+            lines+=['$scope module {} $end'.format(p) for p in path[common:]]
+            scope=path
+            lines.append('$var wire {} {} {} $end'.format(width, code, name))
+
+        lines+=['$upscope $end']*len(scope)
+        lines+=['$enddefinitions $end', '#{}'.format(self.env.now), '$dumpvars']
+        lines+=[self._valueLine(signal, value) for signal, value in enumerate(self.values)]
+        lines.append('$end')
+
+        self.time=self.env.now
+        self.headerWritten=True
+        self.file.write('\n'.join(lines)+'\n')
+
+    def _valueLine(self, signal, value):
+
+        fullname, name, width, code=self.signals[signal]
+        if width==1:
+            return ('x' if value is None else str(int(bool(value))))+code
+        return 'b{} {}'.format('x' if value is None else '{:b}'.format(value), code)
+
+    def change(self, signal, value):
+
+        if self.env.now!=self.time:
+            self._emit()
+            self.time=self.env.now
+        self.pending[signal]=value
+
+    def _emit(self):
+        """writes the changes of the last tick that changed any signal"""
+
+        changed=[(signal, value) for signal, value in self.pending.items() if self.values[signal]!=value]
+        self.pending.clear()
+        if not changed:
+            return
+
+        self.lines.append('#{}'.format(self.time))
+        for signal, value in changed:
+            self.values[signal]=value
+            self.lines.append(self._valueLine(signal, value))
+
+        if len(self.lines)>=self.bufferSize:
+            self._flush()
+
+    def _flush(self):
+
+        if self.lines:
+            self.file.write('\n'.join(self.lines)+'\n')
+            self.lines=[]
+
+    def close(self):
+
+        if self.file.closed:
+            return
+        if not self.headerWritten:
+            self.file.close()
+            return
+
+        self._emit()
+        # mark the end of the simulation so that viewers show the last values up to it
+        if self.env.now!=self.time:
+            self.lines.append('#{}'.format(self.env.now))
+        self._flush()
+        self.file.close()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+
+        self.close()
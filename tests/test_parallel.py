@@ -0,0 +1,79 @@
+import unittest
+from functools import partial
+from Platforms import Platform, ParallelRunner
+from Components.BasicComponent import Unit
+from Components.Buffers import FlowControlledBuffer
+from Components.Pipelines import FlowControlledPipeline
+from Components.Packets import BasePacket
+from Components.Watchdogs import DeadlockWatchdog
+
+stages=6
+
+#---------------------------------------------------------------------------------
+# A ring of stages injecting packets and forwarding those of the others for a random number of hops. Once the
+# buffers of the ring are full, every stage waits for credits to put a packet into its pipeline: a deadlock
+#---------------------------------------------------------------------------------
+class RingStage(Unit):
+
+    def __init__(self, env, name, parent, packets):
+        super().__init__(env, name, parent)
+        self.igports={'i':FlowControlledBuffer(env,'i',parent=self,capacity=2)}
+        self.egports={'e':FlowControlledPipeline(env,'e',parent=self,depth=2,putBytesPerCycle=8,initCredits=2)}
+        self.connect(fromUnit=self,toUnit=self.igports['i'],fromPort='i')
+        self.connect(fromUnit=self.egports['e'],toUnit=self,toPort='e')
+        self.packets=packets
+
+    def run(self):
+        buffer=self.igports['i']
+        pipeline=self.egports['e']
+        sent=0
+        while True:
+            if sent<self.packets and (not buffer.items or self.rng.random()<0.2):
+                yield pipeline.put(BasePacket(fields={'hops':self.rng.randint(1, stages)}))
+                sent+=1
+            else:
+                pkt=yield buffer.peek()
+                yield buffer.get()
+                pkt.f['hops']-=1
+                if pkt.f['hops']:
+                    yield pipeline.put(pkt)
+                else:
+                    yield self.env.timeout(self.rng.randint(0, 20))
+
+class Ring(Platform):
+
+    def __init__(self, env, name, packets, seed, watchdog=False):
+        super().__init__(env, name, None)
+        units=[RingStage(env,'stage{}'.format(i),self,packets) for i in range(stages)]
+        for unit in units:
+            self.insertUnit(unit)
+        for fromUnit, toUnit in zip(units, units[1:]+units[:1]):
+            self.connect(fromUnit=fromUnit,toUnit=toUnit,fromPort='e',toPort='i')
+        self.unitConns()
+        self.setMasterSeed(seed)
+        if watchdog:
+            self.watchdog=DeadlockWatchdog(env,'watchdog',self,stallCycles=100)
+
+def makeRing(env, packets, seed, watchdog=False):
+    return Ring(env, 'Ring', packets, seed, watchdog)
+
+class ParallelRunnerTest(unittest.TestCase):
+
+    def test_matchesSequential(self):
+
+        # seeds 4 with 4 packets and 2 with 8 packets deadlock the ring
+        for packets, seed, partitions in ((4, 1, 2), (4, 4, 3), (8, 2, 2), (8, 1, [['stage0', 'stage3'], ['stage1', 'stage2', 'stage4', 'stage5']])):
+            runner=ParallelRunner(partial(makeRing, packets=packets, seed=seed), partitions=partitions)
+            sequential=runner.runSequential(5000)
+            self.assertEqual(runner.run(5000), sequential)
+
+    def test_platformWatchdog(self):
+
+        runner=ParallelRunner(partial(makeRing, packets=4, seed=1, watchdog=True), partitions=2)
+        with self.assertRaises(RuntimeError):
+            runner.run(5000)
+        with self.assertRaises(RuntimeError):
+            runner.runSequential(5000)
+
+if __name__=='__main__':
+    unittest.main()
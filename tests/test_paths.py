@@ -0,0 +1,98 @@
+import unittest
+from simpy import Environment
+from Platforms import Platform
+from Components.BasicComponent import Unit
+from Components.Buffers import FlowControlledBuffer
+from Components.Pipelines import FlowControlledPipeline
+from Components.Packets import BasePacket
+from simpyExtensions.paths import PathRecorder
+
+stages=12
+packets=200
+
+#---------------------------------------------------------------------------------
+# A line of stages, each a buffer draining into a pipeline: every packet makes 2 hops per stage
+#---------------------------------------------------------------------------------
+class Source(Unit):
+
+    def __init__(self, env, name, parent):
+        super().__init__(env, name, parent)
+        self.egports={'e':FlowControlledPipeline(env,'e',parent=self,depth=2,putBytesPerCycle=8,initCredits=2)}
+        self.connect(fromUnit=self.egports['e'],toUnit=self,toPort='e')
+
+    def run(self):
+        for i in range(packets):
+            yield self.egports['e'].put(BasePacket())
+
+class Stage(Unit):
+
+    def __init__(self, env, name, parent):
+        super().__init__(env, name, parent)
+        self.igports={'i':FlowControlledBuffer(env,'i',parent=self,capacity=2)}
+        self.egports={'e':FlowControlledPipeline(env,'e',parent=self,depth=2,putBytesPerCycle=8,initCredits=2)}
+        self.connect(fromUnit=self,toUnit=self.igports['i'],fromPort='i')
+        self.connect(fromUnit=self.egports['e'],toUnit=self,toPort='e')
+
+    def run(self):
+        while True:
+            pkt=yield self.igports['i'].peek()
+            yield self.igports['i'].get()
+            yield self.egports['e'].put(pkt)
+
+class Sink(Unit):
+
+    def __init__(self, env, name, parent):
+        super().__init__(env, name, parent)
+        self.igports={'i':FlowControlledBuffer(env,'i',parent=self,capacity=2)}
+        self.connect(fromUnit=self,toUnit=self.igports['i'],fromPort='i')
+        self.paths=None
+        self.delivered=[]
+
+    def run(self):
+        while True:
+            pkt=yield self.igports['i'].peek()
+            yield self.igports['i'].get()
+            self.delivered.append(self.paths.path(pkt.uid))
+            self.paths.release(pkt.uid)
+
+class Line(Platform):
+
+    def __init__(self, env, name):
+        super().__init__(env, name, None)
+        units=[Source(env,'source',self)]+[Stage(env,'stage{}'.format(i),self) for i in range(stages)]
+        self.sink=Sink(env,'sink',self)
+        units.append(self.sink)
+        for unit in units:
+            self.insertUnit(unit)
+        for fromUnit, toUnit in zip(units, units[1:]):
+            self.connect(fromUnit=fromUnit,toUnit=toUnit,fromPort='e',toPort='i')
+        self.unitConns()
+
+class PathRecorderTest(unittest.TestCase):
+
+    def test_longPathsReleased(self):
+
+        env=Environment()
+        line=Line(env,'Line')
+        paths=PathRecorder(chunks=4, chunkHops=4)
+        paths.attach(line)
+        line.sink.paths=paths
+        env.run(until=100000)
+
+        # every hop of every packet is recorded, however many chunks its path takes
+        self.assertEqual(len(line.sink.delivered), packets)
+        for path in line.sink.delivered:
+            self.assertEqual(len(path), 2*stages+2)
+            self.assertEqual([hop[0] for hop in path][:3], ['Line.source.e', 'Line.stage0.i', 'Line.stage0.e'])
+            self.assertTrue(all(enter<=leave for fullname, enter, leave in path[:-1]))
+
+        # the released paths gave their chunks back, only the packets in flight ever held some
+        self.assertEqual(paths.paths, {})
+        self.assertLess(paths.allocated, packets*paths.chunkSize)
+        self.assertEqual(len(paths.freeChunks)*paths.chunkSize, paths.allocated)
+
+        # the statistics still count the hops of the released packets
+        self.assertEqual(paths.hopStats()['Line.stage5.i'][0], packets)
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from simpy import Environment
+from Components.Packets import BasePacket
+from simpyExtensions.profiler import SimProfiler
+from simpyExtensions.paths import PathRecorder
+from tests.test_paths import Line
+
+class SimProfilerTest(unittest.TestCase):
+
+    def run_line(self, sampleEvery):
+
+        BasePacket.nextuid=0
+        env=Environment()
+        with SimProfiler(env, sampleEvery) as profiler:
+            line=Line(env,'Line')
+            line.sink.paths=PathRecorder()
+            line.sink.paths.attach(line)
+            env.run(until=300)
+            # the run stops from the callback of the until event, the events scheduled from now on are setup again
+            current=profiler.current
+            env.run(until=600)
+        return profiler, current
+
+    def test_currentRestored(self):
+
+        profiler, current=self.run_line(1)
+        self.assertIs(current, profiler.setupStats)
+        self.assertIs(profiler.current, profiler.setupStats)
+        self.assertIn(('Line.stage3.i', 'FlowControlledBuffer._trigger_put'), [row[:2] for row in profiler.table()])
+
+    def test_sampled(self):
+
+        full=sum(self.run_line(1)[0].processed.values())
+        sampled, current=self.run_line(10)
+        self.assertNotIn(('(setup)', ''), sampled.callbackStats)
+        self.assertAlmostEqual(sum(sampled.processed.values()), full/10, delta=full/100)
+
+if __name__=='__main__':
+    unittest.main()
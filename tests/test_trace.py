@@ -0,0 +1,134 @@
+import io
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+from simpy import Environment
+from Platforms import Platform
+from Components.BasicComponent import Unit
+from Components.Buffers import FlowControlledBuffer
+from Components.Pipelines import FlowControlledPipeline
+from Components.Arbiters import RoundRobinCrossbar
+from Components.Packets import BasePacket
+from simpyExtensions.trace import TraceRecorder, ChunkedTraceRecorder, openTrace, XBAR_ELECTED_RR_UNMASKED
+
+inPorts=70
+
+#---------------------------------------------------------------------------------
+# A crossbar with more inPorts than a 64 bit mask holds, all its sources sending at once
+#---------------------------------------------------------------------------------
+class Source(Unit):
+
+    def __init__(self, env, name, parent):
+        super().__init__(env, name, parent)
+        self.egports={'e':FlowControlledPipeline(env,'e',parent=self,depth=2,putBytesPerCycle=8,initCredits=2)}
+        self.connect(fromUnit=self.egports['e'],toUnit=self,toPort='e')
+
+    def run(self):
+        for i in range(3):
+            yield self.egports['e'].put(BasePacket())
+
+class Switch(Unit):
+
+    def __init__(self, env, name, parent):
+        super().__init__(env, name, parent)
+        self.igports={i:FlowControlledBuffer(env,'i{}'.format(i),parent=self,capacity=2) for i in range(inPorts)}
+        self.xbar=RoundRobinCrossbar(env,'xbar',self,inPorts=inPorts,outPorts=1,pushMode=True)
+        self.egports={'o':FlowControlledPipeline(env,'o',parent=self,depth=2,putBytesPerCycle=8,initCredits=2)}
+        for i in range(inPorts):
+            self.connect(fromUnit=self,toUnit=self.igports[i],fromPort=i)
+            self.connect(fromUnit=self.igports[i],toUnit=self.xbar,toPort=i)
+        self.connect(fromUnit=self.xbar,toUnit=self.egports['o'])
+        self.connect(fromUnit=self.egports['o'],toUnit=self,toPort='o')
+
+class Sink(Unit):
+
+    def __init__(self, env, name, parent):
+        super().__init__(env, name, parent)
+        self.igports={'i':FlowControlledBuffer(env,'i',parent=self,capacity=2)}
+        self.connect(fromUnit=self,toUnit=self.igports['i'],fromPort='i')
+
+    def run(self):
+        while True:
+            yield self.igports['i'].get()
+
+class HighRadix(Platform):
+
+    def __init__(self, env, name):
+        super().__init__(env, name, None)
+        switch=Switch(env,'switch',self)
+        sink=Sink(env,'sink',self)
+        self.insertUnit(switch)
+        self.insertUnit(sink)
+        for i in range(inPorts):
+            source=Source(env,'source{}'.format(i),self)
+            self.insertUnit(source)
+            self.connect(fromUnit=source,toUnit=switch,fromPort='e',toPort=i)
+        self.connect(fromUnit=switch,toUnit=sink,fromPort='o',toPort='i')
+        self.unitConns()
+
+def _run(tracer):
+    """simulates the platform with INFO logging, returns the messages logged"""
+
+    BasePacket.nextuid=0
+    stream=io.StringIO()
+    handler=logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    root=logging.getLogger()
+    level=root.level
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    try:
+        env=Environment()
+        tracer.attach(HighRadix(env,'HighRadix'))
+        env.run(until=5000)
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+    return stream.getvalue().splitlines()
+
+def _unmaskedMessages(trace):
+
+    return [trace.render(record)[2] for record in trace.records() if record[2]==XBAR_ELECTED_RR_UNMASKED]
+
+class HighRadixTraceTest(unittest.TestCase):
+
+    def test_masksRoundTrip(self):
+
+        logged=_run(TraceRecorder())
+        expected=[line for line in logged if 'RoundRobin arbitration between unmasked ports' in line]
+        # packets from more than 64 inPorts waited together, which a mask packed into the record value cannot hold
+        self.assertTrue(any(line.count("'i")>64 for line in expected))
+
+        with tempfile.TemporaryDirectory() as directory:
+            tracer=TraceRecorder()
+            _run(tracer)
+            tracer.save(os.path.join(directory, 'trace.bin'))
+            self.assertEqual(_unmaskedMessages(openTrace(os.path.join(directory, 'trace.bin'))), expected)
+
+            chunked=ChunkedTraceRecorder(os.path.join(directory, 'trace.s4c'), chunkRecords=1000)
+            _run(chunked)
+            chunked.close()
+            self.assertEqual(_unmaskedMessages(openTrace(os.path.join(directory, 'trace.s4c'))), expected)
+
+class QuietHooksTraceTest(unittest.TestCase):
+
+    def test_overriddenMessagesKeepRecords(self):
+
+        tracer=TraceRecorder()
+        _run(tracer)
+        expected=list(tracer.records())
+
+        quiet=TraceRecorder()
+        # customized messages that log nothing do not take the trace records of the events with them
+        with mock.patch.object(FlowControlledBuffer, 'postPutMsg', lambda self, item: None), \
+             mock.patch.object(FlowControlledBuffer, 'postGetMsg', lambda self, item: None), \
+             mock.patch.object(FlowControlledPipeline, 'prePutMsg', lambda self, event: None), \
+             mock.patch.object(FlowControlledPipeline, 'postPutMsg', lambda self, event: None), \
+             mock.patch.object(RoundRobinCrossbar, 'postDecisionMsg', lambda self, candidate: None):
+            _run(quiet)
+        self.assertEqual(list(quiet.records()), expected)
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from simpy import Environment
+from Components.Buffers import FlowControlledBuffer
+from Components.Pipelines import FlowControlledPipeline
+from Components.Packets import BasePacket
+from simpyExtensions.vcd import VcdWriter
+from tests.test_trace import HighRadix
+
+def _dump(path):
+
+    BasePacket.nextuid=0
+    env=Environment()
+    with VcdWriter(path) as vcd:
+        vcd.attach(HighRadix(env,'HighRadix'))
+        env.run(until=5000)
+    with open(path) as f:
+        return f.read()
+
+class QuietHooksVcdTest(unittest.TestCase):
+
+    def test_overriddenMessagesKeepWaveforms(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            expected=_dump(os.path.join(directory, 'expected.vcd'))
+            # customized messages that log nothing leave the occupancy and busy waveforms unchanged
+            with mock.patch.object(FlowControlledBuffer, 'postPutMsg', lambda self, item: None), \
+                 mock.patch.object(FlowControlledBuffer, 'postGetMsg', lambda self, item: None), \
+                 mock.patch.object(FlowControlledPipeline, 'prePutMsg', lambda self, event: None), \
+                 mock.patch.object(FlowControlledPipeline, 'postPutMsg', lambda self, event: None):
+                self.assertEqual(_dump(os.path.join(directory, 'quiet.vcd')), expected)
+
+if __name__=='__main__':
+    unittest.main()
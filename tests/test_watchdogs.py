@@ -0,0 +1,27 @@
+import unittest
+from simpy import Environment
+from Components.Packets import BasePacket
+from Components.Watchdogs import DeadlockWatchdog
+from simpyExtensions.paths import PathRecorder
+from tests.test_paths import Line, packets
+
+class DeadlockWatchdogTest(unittest.TestCase):
+
+    def test_sleepsWhileIdle(self):
+
+        BasePacket.nextuid=0
+        env=Environment()
+        line=Line(env,'Line')
+        line.sink.paths=PathRecorder()
+        watchdog=DeadlockWatchdog(env,'watchdog',line,stallCycles=10)
+        env.run(until=100000)
+
+        self.assertEqual(len(line.sink.delivered), packets)
+        self.assertFalse(watchdog.stalled)
+        # once the packets are delivered the watchdog waits for a put instead of checking every 10 cycles
+        self.assertIsNotNone(watchdog.monitorWake)
+        self.assertLess(watchdog.lastMonitorSample, 20000)
+        self.assertIs(line.units['stage0'].igports['i'].deadlockWatchdog, watchdog)
+
+if __name__=='__main__':
+    unittest.main()